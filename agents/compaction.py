@@ -0,0 +1,41 @@
+from agents.markdown_utils import HEADING_RE, section_heading
+
+def outline_digest(sections, index, neighbours=1):
+    """Compact outline for one section prompt
+
+    Lists every heading so the model knows the shape of the post, but keeps
+    the bullet notes only for the sections right before and after ``index``.
+    The section's own notes are sent separately.
+    """
+    lines = []
+    for position, (heading, description) in enumerate(sections):
+        lines.append(heading)
+        if position != index and abs(position - index) <= neighbours and description:
+            lines.append(description)
+    return "\n".join(lines)
+
+def headings_digest(chunks):
+    """Headings of every chunk, one per line"""
+    return "\n".join(heading for heading in map(section_heading, chunks) if heading)
+
+def document_digest(chunks, max_chars=400):
+    """Headings plus the opening paragraph of each section"""
+    lines = []
+    for chunk in chunks:
+        paragraph = []
+        for line in chunk.split("\n"):
+            if HEADING_RE.match(line):
+                if paragraph:
+                    break
+                lines.append(line.strip())
+            elif line.strip():
+                paragraph.append(line.strip())
+            elif paragraph:
+                break
+        if paragraph:
+            opening = " ".join(paragraph)
+            if len(opening) > max_chars:
+                opening = opening[:max_chars].rsplit(" ", 1)[0] + " ..."
+            lines.append(opening)
+        lines.append("")
+    return "\n".join(lines).strip()
@@ -1,20 +1,73 @@
-from together import Together
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
+import threading
+import time
+
+from agents.compaction import outline_digest
+from agents.llm import LLM, estimate_tokens
+from agents.markdown_utils import section_title
 
 load_dotenv()
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+CONTENT_MAX_CONCURRENCY = int(os.getenv("CONTENT_MAX_CONCURRENCY", "4"))
+CONTENT_SECTION_RETRIES = int(os.getenv("CONTENT_SECTION_RETRIES", "2"))
+# Default section lengths; a word budget is split across sections in the same ratio.
+CONTENT_BOOKEND_WORDS = int(os.getenv("CONTENT_BOOKEND_WORDS", "250"))
+CONTENT_SECTION_WORDS = int(os.getenv("CONTENT_SECTION_WORDS", "400"))
 
 class ContentAgent:
-    def __init__(self):
-        self.client = Together(api_key=TOGETHER_API_KEY)
+    def __init__(self, llm=None, max_concurrency=CONTENT_MAX_CONCURRENCY, section_retries=CONTENT_SECTION_RETRIES,
+                 memo=None, regenerate=(), word_budget=None, audience=None):
+        self.llm = llm or LLM()
+        self.max_concurrency = max_concurrency
+        self.section_retries = section_retries
+        # ``word_budget`` is the length of the whole post; None keeps the
+        # default section lengths. ``audience`` replaces the default HR focus
+        # of the prompts; None keeps it.
+        self.word_budget = word_budget
+        self.audience = audience
+        # With a SectionMemo, sections whose heading and notes are unchanged
+        # are reused; ``regenerate`` names rejected sections to write afresh.
+        self.memo = memo
+        self.regenerate = {section_title(heading) for heading in regenerate}
+
+    def is_rejected(self, heading):
+        return section_title(heading) in self.regenerate
+
+    def memo_inputs(self, heading, description, digest, word_count):
+        # The digest carries the other headings and the neighbours' notes, so
+        # renaming, reordering, adding or removing sections around this one
+        # writes it again.
+        return heading, description, digest, word_count, self.audience
+
+    def is_memoized(self, heading, description, digest, word_count=None):
+        word_count = word_count or self.default_word_count(heading)
+        return self.memo is not None and not self.is_rejected(heading) and self.memo.has(
+            "content.section", *self.memo_inputs(heading, description, digest, word_count)
+        )
+
+    def is_bookend(self, heading):
+        return "Introduction" in heading or "Conclusion" in heading
+
+    def default_word_count(self, heading):
+        if self.is_bookend(heading):
+            return CONTENT_BOOKEND_WORDS
+        return CONTENT_SECTION_WORDS
+
+    def word_counts(self, sections):
+        """Words to write per section, splitting the word budget if there is one"""
+        defaults = [self.default_word_count(heading) for heading, _ in sections]
+        if not self.word_budget:
+            return defaults
+        total = sum(defaults)
+        return [max(50, round(self.word_budget * words / total)) for words in defaults]
 
-    def save_blog_content(self, blog_content):
+    def save_blog_content(self, blog_content, output_dir="output"):
         """Save the generated blog content to a file"""
         try:
-            os.makedirs("output", exist_ok=True)
+            os.makedirs(output_dir, exist_ok=True)
             
-            filepath = os.path.join("output", "blog_post.md")
+            filepath = os.path.join(output_dir, "blog_post.md")
             with open(filepath, "w") as f:
                 f.write(blog_content)
             
@@ -24,11 +77,10 @@ class ContentAgent:
             print(f"Error saving blog content: {str(e)}")
             return False
 
-    def generate(self, outline):
-        sections = outline.split("\n## ")
-        full_blog = []
-
-        for section in sections:
+    def parse_sections(self, outline):
+        """Split the outline into (heading, description) pairs in outline order"""
+        sections = []
+        for section in outline.split("\n## "):
             if not section.strip():
                 continue
 
@@ -38,35 +90,164 @@ class ContentAgent:
             lines = section.strip().split("\n")
             heading = lines[0].strip()  
             description = "\n".join(line for line in lines[1:] if line.strip()) 
+            sections.append((heading, description))
+
+        return sections
+
+    def generate_section(self, outline, heading, description, on_token=None, use_cache=None, word_count=None):
+        """Write a single section of the blog post
+
+        ``outline`` is the outline context for this section, normally the
+        compact digest from ``outline_digest``.
+        """
+        default_word_count = self.default_word_count(heading)
+        word_count = word_count or default_word_count
+        # Token caps scale from the 600/1000 used at the default lengths.
+        base_tokens = 600 if self.is_bookend(heading) else 1000
+        max_tokens = max(200, round(base_tokens * word_count / default_word_count))
+        length = f"about {word_count}" if word_count != default_word_count else str(word_count)
+        focus = f"professional content written for {self.audience}" if self.audience else "professional, HR-focused content"
+
+        prompt = f"""
+        Write a detailed section for a blog post in Markdown format. The post follows this outline:
+        {outline}
+
+        Write this section:
+        {heading}  
+        {description}  
+        Expand this into {length} words of {focus}. 
+        Include relevant trends, strategies, or examples as needed, ensuring the text is engaging and informative.
+        """
+
+        return self.llm.chat(
+            prompt, max_tokens=max_tokens, temperature=0.7, use_cache=use_cache, on_token=on_token,
+            task="content.generate_section"
+        )
 
-            if "Introduction" in heading or "Conclusion" in heading:
-                word_count = 250
-                max_tokens = 600  
+    def generate_section_with_retry(self, outline, index, heading, description, on_delta=None, word_count=None):
+        """Write a section, retrying only this section when its call fails"""
+        on_token = None
+        if on_delta is not None:
+            def on_token(text):
+                on_delta({"section": index, "heading": heading, "text": text})
+
+        # A rejected section must not come back from the response cache.
+        use_cache = False if self.is_rejected(heading) else None
+        for attempt in range(self.section_retries + 1):
+            try:
+                return self.generate_section(
+                    outline, heading, description, on_token=on_token, use_cache=use_cache, word_count=word_count
+                )
+            except Exception as e:
+                if attempt == self.section_retries:
+                    raise
+                print(f"Section '{heading}' failed ({str(e)}), retrying...")
+                if on_delta is not None:
+                    # Tell streaming clients to drop the partial section text.
+                    on_delta({"section": index, "heading": heading, "text": "", "reset": True})
+                time.sleep(2 ** attempt)
+
+    def generate(self, outline, on_delta=None, prefetcher=None):
+        """Write every outline section and join them in outline order
+
+        ``on_delta`` optionally receives ``{"section", "heading", "text"}``
+        payloads while sections are streamed. Sections a ``SectionPrefetcher``
+        already started for the same heading and notes are reused, and so are
+        sections in the memo, unless they were rejected.
+        """
+        sections = self.parse_sections(outline)
+        if not sections:
+            return ""
+        word_counts = self.word_counts(sections)
+
+        # Each prompt gets the headings plus its neighbours' notes instead of
+        # the whole outline, so prompt tokens no longer grow with sections x outline.
+        digests = [outline_digest(sections, index) for index in range(len(sections))]
+        self.llm.record_savings(
+            "content.generate_section",
+            sum(estimate_tokens(outline) - estimate_tokens(digest) for digest in digests)
+        )
+
+        # Sections only depend on the outline, so they are written concurrently
+        # and reassembled in outline order.
+        def write(item):
+            index, (heading, description) = item
+            word_count = word_counts[index]
+            memo_inputs = self.memo_inputs(heading, description, digests[index], word_count)
+            if self.is_memoized(heading, description, digests[index], word_count):
+                text = self.memo.get("content.section", *memo_inputs)
             else:
-                word_count = 400  
-                max_tokens = 1000  
-
-            prompt = f"""
-            Write a detailed section for a blog post in Markdown format based on this {outline}:  
-            {heading}  
-            {description}  
-            Expand this into {word_count} words of professional, HR-focused content. 
-            Include relevant trends, strategies, or examples as needed, ensuring the text is engaging and informative.
-            """
-
-            response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=0.7  
-            )
-
-            section_content = response.choices[0].message.content.strip()
-            full_blog.append(section_content)
+                # Prefetched sections were written at the default lengths.
+                future = None
+                if prefetcher is not None and word_count == self.default_word_count(heading):
+                    future = prefetcher.take(index, heading, description)
+                if future is None:
+                    text = self.generate_section_with_retry(
+                        digests[index], index, heading, description, on_delta=on_delta, word_count=word_count
+                    )
+                else:
+                    text = future.result()
+                if self.memo is not None:
+                    self.memo.put("content.section", text, *memo_inputs)
+                if future is None:
+                    return text
+
+            # Prefetched and memoized sections were not streamed; send them whole.
+            if on_delta is not None:
+                on_delta({"section": index, "heading": heading, "text": text})
+            return text
+
+        max_workers = max(1, min(self.max_concurrency, len(sections)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="content-section") as pool:
+            full_blog = list(pool.map(write, enumerate(sections)))
 
         final_blog = "\n\n".join(full_blog)
         
-        self.save_blog_content(final_blog)
-        
         return final_blog
 
+class SectionPrefetcher:
+    """Start writing outline sections while the outline is still streaming
+
+    ``feed`` is used as the planning ``on_token`` callback. A section is
+    dispatched once the next ``##`` heading shows that its notes are
+    complete, with a digest of the outline received so far as context.
+    ``ContentAgent.generate`` later picks the results up with ``take``.
+    """
+
+    def __init__(self, content_agent, prepare=None):
+        self.agent = content_agent
+        self.prepare = prepare or (lambda outline: outline.strip())
+        self.pool = ThreadPoolExecutor(max_workers=content_agent.max_concurrency, thread_name_prefix="content-prefetch")
+        self.text = ""
+        self.futures = {}
+        self._lock = threading.Lock()
+
+    def feed(self, text):
+        with self._lock:
+            self.text += text
+            boundary = self.text.rfind("\n## ")
+            if boundary == -1:
+                return
+            complete = self.prepare(self.text[:boundary])
+            sections = self.agent.parse_sections(complete) if complete else []
+            for index, (heading, description) in enumerate(sections):
+                if index in self.futures:
+                    continue
+                digest = outline_digest(sections, index)
+                if self.agent.is_memoized(heading, description, digest):
+                    continue
+                future = self.pool.submit(
+                    self.agent.generate_section_with_retry, digest, index, heading, description
+                )
+                self.futures[index] = (heading, description, future)
+
+    def take(self, index, heading, description):
+        """Return the future for a section if it was started with the same content"""
+        with self._lock:
+            entry = self.futures.get(index)
+        if entry is None or entry[:2] != (heading, description):
+            return None
+        return entry[2]
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,90 @@
+from collections import deque
+from dotenv import load_dotenv
+import os
+import threading
+
+load_dotenv()
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+# "provider" hedges Together calls on Cohere and Cohere calls on Together;
+# "model" hedges Together calls on the other model of the task's tier.
+HEDGE_ALTERNATE = os.getenv("HEDGE_ALTERNATE", "provider")
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "100"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+# Hedges may be at most this fraction of the worker's last HEDGE_WINDOW calls...
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+# ...and at most this many per job.
+HEDGE_MAX_PER_JOB = int(os.getenv("HEDGE_MAX_PER_JOB", "3"))
+
+class HedgePolicy:
+    """Decide when a slow call gets a duplicate on an alternate provider
+
+    Each task's recent latencies give its hedge deadline, the ``quantile``
+    of the samples (p90 by default): a call still running past it gets a
+    hedge. Tasks without ``min_samples`` samples are never hedged. Hedges
+    are capped at ``budget`` of the last ``window`` calls so the extra spend
+    stays bounded even when a provider slows down across the board after a
+    long healthy run.
+    """
+
+    def __init__(self, enabled=HEDGE_ENABLED, alternate=HEDGE_ALTERNATE, quantile=HEDGE_QUANTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW, min_delay=HEDGE_MIN_DELAY,
+                 budget=HEDGE_BUDGET, max_per_job=HEDGE_MAX_PER_JOB):
+        self.enabled = enabled
+        self.alternate = alternate
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_per_job = max_per_job
+        self.calls = 0
+        # Call numbers at which recent hedges started, oldest first.
+        self._hedges = deque()
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, task, seconds):
+        """Add the latency of a finished call, including ones that lost a hedge"""
+        with self._lock:
+            self._samples.setdefault(task, deque(maxlen=self.window)).append(seconds)
+
+    def deadline(self, task):
+        """Return how long to wait before hedging a new call, or None to not hedge it"""
+        with self._lock:
+            self.calls += 1
+            samples = sorted(self._samples.get(task, ()))
+        if not self.enabled or len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay, samples[int(self.quantile * (len(samples) - 1))])
+
+    def try_start(self, job_hedges):
+        """Claim budget for one hedge; ``job_hedges`` is how many the job already sent"""
+        if job_hedges >= self.max_per_job:
+            return False
+        with self._lock:
+            while self._hedges and self._hedges[0] <= self.calls - self.window:
+                self._hedges.popleft()
+            if len(self._hedges) + 1 > self.budget * min(self.calls, self.window):
+                return False
+            self._hedges.append(self.calls)
+            return True
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def get_hedger():
+    """Return the process-wide hedge policy"""
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = HedgePolicy()
+        return _hedger
+
+def set_hedger(hedger):
+    """Replace the process-wide hedge policy, e.g. to disable hedging in a benchmark"""
+    global _hedger
+    with _hedger_lock:
+        previous, _hedger = _hedger, hedger
+    return previous
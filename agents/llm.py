@@ -0,0 +1,437 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+import logging
+import threading
+import time
+
+from agents.hedging import get_hedger
+from agents.llm_cache import get_default_cache, make_cache_key
+from agents.metrics import record_hedge, record_llm_call, record_prompt_savings
+from agents.providers import get_registry
+from agents.rate_limit import LLM_MAX_RETRIES, backoff_delay, get_scheduler, retry_info
+from agents.routing import MODEL_LARGE, get_router
+
+DEFAULT_MODEL = MODEL_LARGE
+
+trace_logger = logging.getLogger("pipeline.trace")
+
+def estimate_tokens(text):
+    """Rough token count for budgeting, at about four characters per token"""
+    return max(1, len(text or "") // 4)
+
+def parses(parse):
+    """Turn a parser that raises on bad output into a ``cacheable`` check"""
+    def check(text):
+        try:
+            parse(text)
+            return True
+        except Exception:
+            return False
+    return check
+
+class LLM:
+    """Shared entry point for every provider call the agents make
+
+    Every call is cached, rate limited and instrumented here. ``task`` names
+    the calling agent method (e.g. ``"seo.analyze_keywords"``) and tags the
+    per-job trace and the process-wide metrics. Together calls without an
+    explicit ``model`` are routed to a model by task through the router,
+    and non-streaming calls that run past their task's p90 latency are
+    hedged on the alternate provider.
+    """
+
+    def __init__(self, use_cache=True, cache=None, rate_limiter=None, providers=None, job_id=None,
+                 priority="interactive", scheduler=None, max_retries=LLM_MAX_RETRIES, router=None, hedger=None):
+        self.providers = providers or get_registry()
+        self.client = self.providers.together()
+        self.cohere_session = self.providers.cohere_session()
+        self.use_cache = use_cache
+        self.cache = cache if cache is not None else get_default_cache()
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler or get_scheduler()
+        self.router = router or get_router()
+        self.hedger = hedger or get_hedger()
+        self.hedges = 0
+        self.priority = priority
+        self.max_retries = max_retries
+        self.job_id = job_id
+        self.usage = {
+            "calls": 0,
+            "cached_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "prompt_tokens_saved": 0,
+            "hedged_calls": 0
+        }
+        self.trace = []
+        self._lock = threading.Lock()
+
+    def _record(self, trace):
+        with self._lock:
+            self.trace.append(trace)
+            if trace["cache_hit"]:
+                self.usage["cached_calls"] += 1
+            elif not trace["error"]:
+                self.usage["calls"] += 1
+                self.usage["prompt_tokens"] += trace["prompt_tokens"]
+                self.usage["completion_tokens"] += trace["completion_tokens"]
+
+        record_llm_call(trace)
+        trace_logger.info(json.dumps(trace))
+
+    def record_savings(self, task, tokens):
+        """Count the prompt tokens a compacted prompt avoided sending"""
+        if tokens <= 0:
+            return
+        with self._lock:
+            self.usage["prompt_tokens_saved"] += tokens
+        record_prompt_savings(task, tokens)
+
+    def _acquire(self, provider, tokens):
+        """Wait for the job budget and the provider budget, returning the time spent"""
+        started = time.perf_counter()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(priority=self.priority)
+        limiter = self.scheduler.for_provider(provider)
+        if limiter is not None:
+            limiter.acquire(tokens, priority=self.priority)
+        return time.perf_counter() - started
+
+    def _release(self, provider, tokens):
+        limiter = self.scheduler.for_provider(provider)
+        if limiter is not None:
+            limiter.release(tokens)
+
+    def _call(self, task, provider, model, prompt, max_tokens, temperature, use_cache, call, on_token=None,
+              cacheable=None):
+        """Serve a call from the cache, or make it, and record a trace for it
+
+        ``call(model, on_token)`` performs the provider request, streaming to
+        the ``on_token`` callback it is given, and returns
+        ``(text, prompt_tokens, completion_tokens)``. Retryable failures (429,
+        5xx, timeouts) are retried with jittered backoff under the shared
+        provider rate limits. With ``model=None`` the router picks the model
+        for each attempt, and a retry avoids the model that just failed.
+
+        ``cacheable(text)`` decides whether an answer may be cached, so
+        output the caller cannot parse is asked for again next time instead
+        of being served from the cache for the whole TTL.
+        """
+        routed = model is None
+        if routed:
+            model = self.router.candidates(task)[0]
+        agent, _, method = (task or "unknown.unknown").partition(".")
+        trace = {
+            "type": "llm_call",
+            "job_id": self.job_id,
+            "agent": agent,
+            "method": method,
+            "provider": provider,
+            "model": model,
+            "started_at": time.time(),
+            "wall_time": 0.0,
+            "queue_wait": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hit": False,
+            "fallback": False,
+            "hedge": None,
+            "retries": 0,
+            "error": None
+        }
+
+        if use_cache is None:
+            use_cache = self.use_cache
+        key = None
+        if use_cache and self.cache is not None:
+            key = make_cache_key(provider, model, prompt, max_tokens, temperature)
+            cached = self.cache.get(key)
+            if cached is not None and (cacheable is None or cacheable(cached)):
+                trace["cache_hit"] = True
+                self._record(trace)
+                if on_token is not None:
+                    on_token(cached)
+                return cached
+
+        streamed = []
+        def tracked_on_token(text):
+            streamed.append(True)
+            on_token(text)
+
+        # Reserve the worst case against the tokens/min budget and give the
+        # unused part back once the real usage is known.
+        reserved = estimate_tokens(prompt) + max_tokens
+        preferred, failed = model, []
+        queue_wait = 0.0
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                queue_wait += self._acquire(provider, reserved)
+                if routed:
+                    model = self.router.choose(task, avoid=failed)
+                try:
+                    result = self._attempt(
+                        trace, model, routed, call, tracked_on_token if on_token else None,
+                        (prompt, max_tokens, temperature)
+                    )
+                    text, prompt_tokens, completion_tokens, answered_by, answered_model = result
+                    # After a winning hedge the primary's real usage is unknown,
+                    # so its reservation is kept.
+                    if trace["hedge"] != "won":
+                        self._release(provider, reserved - prompt_tokens - completion_tokens)
+                    break
+                except Exception as e:
+                    if routed:
+                        failed.append(model)
+                    retryable, status, retry_after = retry_info(e)
+                    # A partly streamed answer cannot be retried transparently.
+                    if not retryable or streamed or attempt == self.max_retries:
+                        raise
+                    limiter = self.scheduler.for_provider(provider)
+                    if status == 429 and limiter is not None:
+                        limiter.pause(retry_after or backoff_delay(attempt))
+                    trace["retries"] += 1
+                    print(f"Retrying {task} after {type(e).__name__} (attempt {attempt + 1})")
+                    time.sleep(backoff_delay(attempt, retry_after))
+        except Exception as e:
+            trace["error"] = f"{type(e).__name__}: {str(e)}"
+            raise
+        else:
+            trace["prompt_tokens"] = prompt_tokens
+            trace["completion_tokens"] = completion_tokens
+            provider, model = answered_by, answered_model
+        finally:
+            trace["provider"] = provider
+            trace["model"] = model
+            trace["fallback"] = model != preferred and trace["hedge"] != "won"
+            trace["queue_wait"] = round(queue_wait, 4)
+            trace["wall_time"] = round(time.perf_counter() - started, 4)
+            self._record(trace)
+
+        if key is not None and text and (cacheable is None or cacheable(text)):
+            # Stored under the model that answered, so a fallback or hedge
+            # answer is not served later to a call that expects the preferred model.
+            self.cache.set(make_cache_key(provider, model, prompt, max_tokens, temperature), text)
+        return text
+
+    def _attempt(self, trace, model, routed, call, on_token, request):
+        """Make one attempt, hedging it when it runs past the task's deadline
+
+        Returns ``(text, prompt_tokens, completion_tokens, provider, model)``
+        for whichever request answered first.
+        """
+        task, provider = f"{trace['agent']}.{trace['method']}", trace["provider"]
+        started = time.perf_counter()
+
+        def primary():
+            try:
+                text, prompt_tokens, completion_tokens = call(model, on_token)
+            except Exception:
+                if routed:
+                    self.router.finish(model, time.perf_counter() - started, error=True)
+                raise
+            if routed:
+                self.router.finish(model, time.perf_counter() - started, completion_tokens)
+            self.hedger.record(task, time.perf_counter() - started)
+            return text, prompt_tokens, completion_tokens, provider, model
+
+        # A streamed answer has already reached the caller, so it is never hedged.
+        deadline = None if on_token is not None else self.hedger.deadline(task)
+        if deadline is None:
+            return primary()
+
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="llm-hedge")
+        try:
+            first = pool.submit(primary)
+            done, _ = wait([first], timeout=deadline)
+            if done or not self.hedger.try_start(self.hedges):
+                return first.result()
+
+            alt_provider, alt_model = self._alternate(task, provider, model)
+            print(f"Hedging {task} on {alt_provider}/{alt_model} after {deadline:.1f}s")
+            with self._lock:
+                self.hedges += 1
+                self.usage["hedged_calls"] += 1
+            second = pool.submit(self._hedge_call, task, alt_provider, alt_model, request)
+
+            pending, error = {first, second}, None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    trace["hedge"] = "won" if future is second else "lost"
+                    record_hedge(task, trace["hedge"])
+                    # The loser cannot be interrupted mid-request; its tokens
+                    # are still counted once it finishes.
+                    loser = second if future is first else first
+                    loser.add_done_callback(lambda f: self._record_loser(trace, f))
+                    return result
+            raise error
+        finally:
+            pool.shutdown(wait=False)
+
+    def _alternate(self, task, provider, model):
+        """Pick the provider and model a hedge for this call goes to"""
+        if provider == "cohere":
+            return "together", self.router.candidates(task)[0]
+        if self.hedger.alternate == "model":
+            others = [candidate for candidate in self.router.candidates(task) if candidate != model]
+            if others:
+                return "together", others[0]
+        return "cohere", "generate"
+
+    def _hedge_call(self, task, provider, model, request):
+        prompt, max_tokens, temperature = request
+        reserved = estimate_tokens(prompt) + max_tokens
+        self._acquire(provider, reserved)
+        text, prompt_tokens, completion_tokens = self._provider_call(provider, *request)(model, None)
+        self._release(provider, reserved - prompt_tokens - completion_tokens)
+        return text, prompt_tokens, completion_tokens, provider, model
+
+    def _record_loser(self, trace, future):
+        """Account for the tokens of the request that lost a hedge"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        _, prompt_tokens, completion_tokens, provider, model = future.result()
+        self._record({
+            **trace,
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "fallback": False,
+            "hedge": "loser",
+            "retries": 0,
+            "error": None
+        })
+
+    def _provider_call(self, provider, prompt, max_tokens, temperature):
+        if provider == "cohere":
+            return self._cohere_call(prompt, max_tokens, temperature)
+        return self._together_call(prompt, max_tokens, temperature)
+
+    def chat(self, prompt, max_tokens, temperature, model=None, use_cache=None, on_token=None, task=None,
+             cacheable=None):
+        """Run a single-turn Together chat completion and return its text
+
+        When ``on_token`` is given the completion is streamed and the callback
+        receives each text delta as it arrives. ``model`` pins the model;
+        otherwise it is routed by ``task``. ``cacheable`` is described in ``_call``.
+        """
+        call = self._together_call(prompt, max_tokens, temperature)
+        return self._call(
+            task, "together", model, prompt, max_tokens, temperature, use_cache, call, on_token, cacheable
+        )
+
+    def _together_call(self, prompt, max_tokens, temperature):
+        def call(model, on_token):
+            if on_token is not None:
+                return self._stream_chat(prompt, max_tokens, temperature, model, on_token)
+
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            text = response.choices[0].message.content.strip()
+
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                return text, usage.prompt_tokens, usage.completion_tokens
+            return text, estimate_tokens(prompt), estimate_tokens(text)
+
+        return call
+
+    def _stream_chat(self, prompt, max_tokens, temperature, model, on_token):
+        """Stream a chat completion, forwarding deltas and returning the full text"""
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+
+        text = "".join(parts).strip()
+        return text, estimate_tokens(prompt), estimate_tokens(text)
+
+    def cohere_generate(self, prompt, max_tokens, temperature, use_cache=None, on_token=None, task=None,
+                        cacheable=None):
+        """Run a Cohere /v1/generate call and return its text
+
+        When ``on_token`` is given the generation is streamed and the
+        callback receives each text delta as it arrives.
+        """
+        call = self._cohere_call(prompt, max_tokens, temperature)
+        return self._call(
+            task, "cohere", "generate", prompt, max_tokens, temperature, use_cache, call, on_token, cacheable
+        )
+
+    def _cohere_call(self, prompt, max_tokens, temperature):
+        def call(model, on_token):
+            payload = {
+                "prompt": prompt,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "return_likelihoods": "NONE"
+            }
+            if on_token is not None:
+                return self._stream_cohere(prompt, payload, on_token)
+
+            response = self.cohere_session.post(
+                self.providers.cohere_url, json=payload, timeout=self.providers.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+            text = data["generations"][0]["text"].strip()
+
+            billed = data.get("meta", {}).get("billed_units", {})
+            return (
+                text,
+                billed.get("input_tokens", estimate_tokens(prompt)),
+                billed.get("output_tokens", estimate_tokens(text))
+            )
+
+        return call
+
+    def _stream_cohere(self, prompt, payload, on_token):
+        """Stream a Cohere generation, forwarding deltas and returning the full text"""
+        response = self.cohere_session.post(
+            self.providers.cohere_url, json={**payload, "stream": True}, timeout=self.providers.timeout, stream=True
+        )
+        try:
+            response.raise_for_status()
+            parts, billed = [], {}
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("is_finished"):
+                    billed = event.get("response", {}).get("meta", {}).get("billed_units", {})
+                    break
+                if event.get("text"):
+                    parts.append(event["text"])
+                    on_token(event["text"])
+        finally:
+            response.close()
+
+        text = "".join(parts).strip()
+        return (
+            text,
+            billed.get("input_tokens", estimate_tokens(prompt)),
+            billed.get("output_tokens", estimate_tokens(text))
+        )
@@ -0,0 +1,256 @@
+import re
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+LIST_ITEM_RE = re.compile(r"^(\s*)([*+-]|\d+[.)])\s+(.*)$")
+TOC_TITLE_RE = re.compile(r"table of contents", re.IGNORECASE)
+# "1. Intro", "2) Setup" or "1.2 Details"; a bare "2025 Trends" is not a number.
+HEADING_NUMBER_RE = re.compile(r"^(?:\d+[.)]|\d+(?:\.\d+)+\.?)\s+")
+
+def slugify(text):
+    """Build a GitHub-style anchor for a heading"""
+    text = re.sub(r"[*_`\[\]()]", "", text).strip().lower()
+    text = re.sub(r"[^\w\s-]", "", text)
+    return re.sub(r"\s+", "-", text)
+
+def _split_blocks(lines):
+    """Yield (is_code, lines) runs so fenced code is never rewritten"""
+    block, in_code = [], False
+    for line in lines:
+        if line.strip().startswith("```"):
+            if not in_code:
+                if block:
+                    yield False, block
+                block, in_code = [line], True
+            else:
+                block.append(line)
+                yield True, block
+                block, in_code = [], False
+            continue
+        block.append(line)
+    if block:
+        yield in_code, block
+
+def fix_heading_hierarchy(lines):
+    """Keep a single H1 and never skip a heading level"""
+    fixed = []
+    seen_h1 = False
+    previous_level = 0
+    for line in lines:
+        match = HEADING_RE.match(line)
+        if not match:
+            fixed.append(line)
+            continue
+
+        level, title = len(match.group(1)), match.group(2)
+        if level == 1:
+            if seen_h1:
+                level = 2
+            seen_h1 = True
+        elif not seen_h1 and previous_level == 0:
+            level, seen_h1 = 1, True
+        elif level > previous_level + 1:
+            level = previous_level + 1
+
+        previous_level = level
+        fixed.append(f"{'#' * level} {title}")
+    return fixed
+
+def number_headings(lines):
+    """Make H2/H3 numbering consistent after sections were edited separately
+
+    If most H2 headings are numbered, every H2 is renumbered in order (and
+    H3s as ``n.m`` when most of them were numbered too); otherwise stray
+    numbers are dropped from the H2s. Posts without numbered H2s are left
+    as they are.
+    """
+    headings = []
+    for index, line in enumerate(lines):
+        match = HEADING_RE.match(line)
+        if match and len(match.group(1)) in (2, 3) and not TOC_TITLE_RE.search(match.group(2)):
+            headings.append((index, len(match.group(1)), match.group(2)))
+
+    h2 = [title for _, level, title in headings if level == 2]
+    h3 = [title for _, level, title in headings if level == 3]
+    numbered_h2 = sum(1 for title in h2 if HEADING_NUMBER_RE.match(title))
+    if not numbered_h2:
+        return lines
+    number_h2 = numbered_h2 * 2 >= len(h2)
+    number_h3 = number_h2 and sum(1 for title in h3 if HEADING_NUMBER_RE.match(title)) * 2 > len(h3)
+
+    fixed = list(lines)
+    section = subsection = 0
+    for index, level, title in headings:
+        if level == 2:
+            section, subsection = section + 1, 0
+            title = HEADING_NUMBER_RE.sub("", title)
+            fixed[index] = f"## {section}. {title}" if number_h2 else f"## {title}"
+        elif number_h3:
+            subsection += 1
+            fixed[index] = f"### {section}.{subsection} {HEADING_NUMBER_RE.sub('', title)}"
+    return fixed
+
+def normalize_lists(lines):
+    """Use '-' for bullets and put blank lines around list blocks"""
+    fixed = []
+    previous_is_item = False
+    for line in lines:
+        match = LIST_ITEM_RE.match(line)
+        if match:
+            indent, marker, text = match.groups()
+            if marker in ("*", "+"):
+                marker = "-"
+            if not previous_is_item and fixed and fixed[-1].strip():
+                fixed.append("")
+            fixed.append(f"{indent}{marker} {text}")
+            previous_is_item = True
+            continue
+
+        if previous_is_item and line.strip() and not line.startswith(" "):
+            fixed.append("")
+        fixed.append(line.rstrip())
+        previous_is_item = previous_is_item and (not line.strip() or line.startswith(" "))
+    return fixed
+
+def space_headings(lines):
+    """Surround headings with exactly one blank line"""
+    fixed = []
+    for line in lines:
+        if HEADING_RE.match(line):
+            if fixed and fixed[-1].strip():
+                fixed.append("")
+            fixed.append(line)
+            fixed.append("")
+            continue
+        fixed.append(line)
+    return fixed
+
+def collapse_blank_lines(lines):
+    fixed = []
+    for line in lines:
+        if not line.strip() and (not fixed or not fixed[-1].strip()):
+            continue
+        fixed.append(line.rstrip())
+    while fixed and not fixed[-1].strip():
+        fixed.pop()
+    return fixed
+
+def remove_toc(lines):
+    """Drop an existing table of contents section so it can be regenerated"""
+    fixed = []
+    skipping = False
+    for line in lines:
+        match = HEADING_RE.match(line)
+        if match and TOC_TITLE_RE.search(match.group(2)):
+            skipping = True
+            continue
+        if skipping and match:
+            skipping = False
+        if not skipping:
+            fixed.append(line)
+    return fixed
+
+def build_toc(lines):
+    """Render a table of contents from the H2 and H3 headings"""
+    entries = []
+    for line in lines:
+        match = HEADING_RE.match(line)
+        if not match:
+            continue
+        level, title = len(match.group(1)), match.group(2)
+        if level in (2, 3):
+            indent = "  " * (level - 2)
+            entries.append(f"{indent}- [{title}](#{slugify(title)})")
+    return entries
+
+def insert_toc(lines):
+    """Place a regenerated table of contents before the first H2"""
+    toc = build_toc(lines)
+    if len([entry for entry in toc if entry.startswith("-")]) < 2:
+        return lines
+
+    for index, line in enumerate(lines):
+        match = HEADING_RE.match(line)
+        if match and len(match.group(1)) == 2:
+            return lines[:index] + ["## Table of Contents", ""] + toc + [""] + lines[index:]
+    return lines
+
+def split_sections(content):
+    """Split markdown into a preamble and one chunk per H2 section
+
+    Headings inside fenced code never start a new chunk.
+    """
+    chunks, current = [], []
+    for is_code, block in _split_blocks(content.replace("\r\n", "\n").split("\n")):
+        if is_code:
+            current.extend(block)
+            continue
+        for line in block:
+            match = HEADING_RE.match(line)
+            if match and len(match.group(1)) == 2 and any(l.strip() for l in current):
+                chunks.append("\n".join(current).strip())
+                current = []
+            current.append(line)
+    if any(line.strip() for line in current):
+        chunks.append("\n".join(current).strip())
+    return chunks
+
+def join_sections(chunks):
+    """Stitch chunks back together, renumbering headings and rebuilding the TOC"""
+    return normalize_markdown("\n\n".join(chunk.strip() for chunk in chunks if chunk.strip()))
+
+def section_heading(chunk):
+    """Return the first heading line of a chunk, or None"""
+    for line in chunk.split("\n"):
+        if HEADING_RE.match(line):
+            return line.strip()
+        if line.strip():
+            return None
+    return None
+
+def section_title(heading):
+    """Heading text without hashes or numbering, casefolded for matching"""
+    match = HEADING_RE.match((heading or "").strip())
+    title = match.group(2) if match else (heading or "").strip()
+    return HEADING_NUMBER_RE.sub("", title).strip().casefold()
+
+def is_toc_section(chunk):
+    heading = section_heading(chunk)
+    return heading is not None and bool(TOC_TITLE_RE.search(heading))
+
+def has_body(chunk):
+    """True when a chunk has text besides headings"""
+    return any(line.strip() and not HEADING_RE.match(line) for line in chunk.split("\n"))
+
+def normalize_markdown(content, with_toc=True):
+    """Deterministic replacement for the LLM markdown structure pass
+
+    Fixes heading hierarchy and numbering, list markers and spacing, blank
+    lines between sections, and regenerates the table of contents. Fenced code blocks are
+    left untouched.
+    """
+    if not content:
+        return content
+
+    lines = content.replace("\r\n", "\n").split("\n")
+
+    # Swap code blocks for placeholder lines so no rule rewrites them.
+    code_blocks = []
+    output = []
+    for is_code, block in _split_blocks(lines):
+        if is_code:
+            output.extend(["", f"\x00code{len(code_blocks)}\x00", ""])
+            code_blocks.append("\n".join(block))
+        else:
+            output.extend(block)
+
+    output = normalize_lists(output)
+    output = fix_heading_hierarchy(output)
+    output = number_headings(output)
+    output = space_headings(output)
+    if with_toc:
+        output = insert_toc(remove_toc(output))
+    normalized = "\n".join(collapse_blank_lines(output)) + "\n"
+
+    for index, block in enumerate(code_blocks):
+        normalized = normalized.replace(f"\x00code{index}\x00", block)
+    return normalized
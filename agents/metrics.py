@@ -0,0 +1,161 @@
+from collections import deque
+import threading
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+                self._histograms[key] = histogram
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """Render every metric in the Prometheus exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, "counts": list(h["counts"])} for key, h in self._histograms.items()}
+
+        lines = []
+        names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+        for name in names:
+            kind, help_text = self._help.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {round(histogram['sum'], 6)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+class StageHistory:
+    """Recent stage durations, used to estimate how long a stage will take"""
+
+    def __init__(self, max_samples=200, min_samples=5):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.max_samples)).append(seconds)
+
+    def median(self, stage):
+        """Return the median duration of a stage, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(0.5 * (len(samples) - 1))]
+
+    def estimate(self, stage, default):
+        """Return a "low-high seconds" range from the observed p50 and p90"""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return default
+
+        low = samples[int(0.5 * (len(samples) - 1))]
+        high = samples[int(0.9 * (len(samples) - 1))]
+        low, high = int(low), max(int(low) + 1, int(round(high)))
+        return f"{low}-{high} seconds"
+
+metrics = MetricsRegistry()
+stage_history = StageHistory()
+
+metrics.describe("llm_requests_total", "counter", "Provider calls by agent, method, model and outcome")
+metrics.describe("llm_request_seconds", "histogram", "Wall time of provider calls, including retries")
+metrics.describe("llm_queue_wait_seconds", "histogram", "Time spent waiting for the rate limiter")
+metrics.describe("llm_prompt_tokens_total", "counter", "Prompt tokens sent to providers")
+metrics.describe("llm_completion_tokens_total", "counter", "Completion tokens received from providers")
+metrics.describe("llm_cache_hits_total", "counter", "Calls served from the response cache")
+metrics.describe("llm_retries_total", "counter", "Provider call retries")
+metrics.describe("llm_prompt_tokens_saved_total", "counter", "Prompt tokens avoided by compacted prompts")
+metrics.describe("llm_errors_total", "counter", "Provider calls that failed after all retries")
+metrics.describe("llm_hedges_total", "counter", "Hedged provider calls by whether the hedge won")
+metrics.describe("llm_model_fallbacks_total", "counter", "Calls routed away from a task's preferred model")
+metrics.describe("pipeline_stage_seconds", "histogram", "Wall time of each pipeline stage")
+metrics.describe("pipeline_jobs_total", "counter", "Finished pipeline jobs by outcome")
+
+def record_llm_call(trace):
+    """Fold one call trace record into the process-wide metrics"""
+    labels = {
+        "agent": trace["agent"],
+        "method": trace["method"],
+        "model": trace["model"]
+    }
+    if trace["cache_hit"]:
+        metrics.inc("llm_cache_hits_total", **labels)
+        metrics.inc("llm_requests_total", outcome="cache_hit", **labels)
+        return
+
+    outcome = "error" if trace["error"] else "success"
+    metrics.inc("llm_requests_total", outcome=outcome, **labels)
+    metrics.observe("llm_request_seconds", trace["wall_time"], **labels)
+    metrics.observe("llm_queue_wait_seconds", trace["queue_wait"], **labels)
+    metrics.inc("llm_prompt_tokens_total", trace["prompt_tokens"], **labels)
+    metrics.inc("llm_completion_tokens_total", trace["completion_tokens"], **labels)
+    if trace["retries"]:
+        metrics.inc("llm_retries_total", trace["retries"], **labels)
+    if trace["error"]:
+        metrics.inc("llm_errors_total", **labels)
+
+def record_prompt_savings(task, tokens):
+    agent, _, method = task.partition(".")
+    metrics.inc("llm_prompt_tokens_saved_total", tokens, agent=agent, method=method)
+
+def record_model_fallback(task, preferred, model, reason):
+    agent, _, method = task.partition(".")
+    metrics.inc(
+        "llm_model_fallbacks_total", agent=agent, method=method, preferred=preferred, model=model, reason=reason
+    )
+
+def record_hedge(task, outcome):
+    agent, _, method = task.partition(".")
+    metrics.inc("llm_hedges_total", agent=agent, method=method, outcome=outcome)
+
+def record_stage(stage, seconds):
+    metrics.observe("pipeline_stage_seconds", seconds, stage=stage)
+    stage_history.record(stage, seconds)
@@ -1,23 +1,29 @@
-import requests
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
+from agents.llm import LLM
 
 class PlanningAgent:
-    def __init__(self):
-        self.api_url = "https://api.cohere.ai/v1/generate"
-        self.headers = {
-            "Authorization": f"Bearer {COHERE_API_KEY}",
-            "Content-Type": "application/json"
-        }
+    def __init__(self, llm=None):
+        self.llm = llm or LLM()
+
+    def finalize_outline(self, outline, selected_topic):
+        """Make sure the outline starts with a heading; safe on a partial outline"""
+        outline = outline.strip()
+        if outline and not outline.startswith("#"):
+            outline = f"# {selected_topic}\n{outline}"
+        return outline
+
+    def plan(self, research_data, on_token=None):
+        """Outline a post on the selected topic
+
+        ``on_token`` optionally receives the outline text as it streams, so
+        sections can be written before the outline is finished.
+        """
+        # Outlining "Unknown Topic" wastes the rest of the pipeline; fail so
+        # the job can be retried from the research stage instead.
+        if "error" in research_data or not research_data.get("selected_topic"):
+            raise ValueError(f"Research did not produce a selected topic: {research_data.get('error', 'missing topic')}")
 
-    def plan(self, research_data):
-        selected_topic = research_data.get("selected_topic", "Unknown Topic")
+        selected_topic = research_data["selected_topic"]
         selected_topic_details = research_data.get("selected_topic_details", "No details provided.")
-        
-      
 
         prompt = f"""
 Create a detailed blog outline in Markdown format for a 2000-word post on '{selected_topic}'. 
@@ -46,20 +52,9 @@ Focus on:
 - Future implications
 """
 
-        payload = {
-            "prompt": prompt,
-            "max_tokens": 1000,  
-            "temperature": 0.7,  
-            "return_likelihoods": "NONE" 
-        }
+        outline = self.llm.cohere_generate(
+            prompt, max_tokens=1000, temperature=0.7, on_token=on_token, task="planning.plan"
+        )
 
-        response = requests.post(self.api_url, json=payload, headers=self.headers)
-        response.raise_for_status()  
-
-        outline = response.json()["generations"][0]["text"].strip()
-
-        if not outline.startswith("#"):
-            outline = f"# {selected_topic}\n{outline}"
-
-        return outline
+        return self.finalize_outline(outline, selected_topic)
 
@@ -0,0 +1,108 @@
+from together import Together
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+import inspect
+import os
+import requests
+import threading
+
+load_dotenv()
+TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+COHERE_API_KEY = os.getenv("COHERE_API_KEY")
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL")
+COHERE_API_URL = os.getenv("COHERE_API_URL", "https://api.cohere.ai/v1/generate")
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "120"))
+# Retries are handled by LLM under the shared rate limits, so the SDK's own
+# retry loop is off by default.
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "0"))
+# Keep-alive connections per provider. Older Together SDKs (1.x) manage
+# their own sessions and do not take a connection pool.
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", "64"))
+
+class ProviderRegistry:
+    """Long-lived provider clients, created once per worker process
+
+    Clients are built lazily and reused by every job, so keep-alive
+    connections survive between calls. Pass a registry with different base
+    URLs to point the agents at a local stand-in server.
+    """
+
+    def __init__(self, together_api_key=TOGETHER_API_KEY, cohere_api_key=COHERE_API_KEY,
+                 together_base_url=TOGETHER_BASE_URL, cohere_url=COHERE_API_URL,
+                 timeout=PROVIDER_TIMEOUT, max_retries=PROVIDER_MAX_RETRIES, pool_size=PROVIDER_POOL_SIZE):
+        self.together_api_key = together_api_key
+        self.cohere_api_key = cohere_api_key
+        self.together_base_url = together_base_url
+        self.cohere_url = cohere_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+
+        self._together = None
+        self._cohere_session = None
+        self._lock = threading.Lock()
+
+    def _together_kwargs(self):
+        kwargs = {
+            "api_key": self.together_api_key,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries
+        }
+        if self.together_base_url:
+            kwargs["base_url"] = self.together_base_url
+        if "http_client" in inspect.signature(Together.__init__).parameters:
+            import httpx
+            kwargs["http_client"] = httpx.Client(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return kwargs
+
+    def together(self):
+        """Shared synchronous Together client"""
+        with self._lock:
+            if self._together is None:
+                self._together = Together(**self._together_kwargs())
+            return self._together
+
+    def cohere_session(self):
+        """Shared keep-alive session for the Cohere REST API"""
+        with self._lock:
+            if self._cohere_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Authorization": f"Bearer {self.cohere_api_key}",
+                    "Content-Type": "application/json"
+                })
+                self._cohere_session = session
+            return self._cohere_session
+
+    def close(self):
+        with self._lock:
+            if self._cohere_session is not None:
+                self._cohere_session.close()
+            if self._together is not None and hasattr(self._together, "close"):
+                self._together.close()
+            self._together = None
+            self._cohere_session = None
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Return the process-wide provider registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProviderRegistry()
+        return _registry
+
+def set_registry(registry):
+    """Replace the process-wide registry, e.g. with one aimed at a stand-in server"""
+    global _registry
+    with _registry_lock:
+        previous, _registry = _registry, registry
+    return previous
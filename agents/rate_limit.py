@@ -0,0 +1,168 @@
+from dotenv import load_dotenv
+import heapq
+import itertools
+import os
+import random
+import requests
+import threading
+import time
+
+load_dotenv()
+TOGETHER_RPM = float(os.getenv("TOGETHER_RPM", "60"))
+TOGETHER_TPM = float(os.getenv("TOGETHER_TPM", "0"))
+COHERE_RPM = float(os.getenv("COHERE_RPM", "100"))
+COHERE_TPM = float(os.getenv("COHERE_TPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Lower values are served first when callers queue for the same provider.
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute, up to one minute of burst"""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate)
+
+    def take(self, amount):
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.available = min(self.capacity, self.available + amount)
+
+class RateLimiter:
+    """Priority-aware requests/min and tokens/min budget shared across threads
+
+    Waiters are served strictly by priority, then arrival order. A provider
+    ``Retry-After`` pauses the whole limiter so no other caller hammers the
+    provider in the meantime.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _wait_time(self, tokens, now):
+        wait = max(self.paused_until - now, self.requests.wait_time(1, now))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, tokens=0, priority="interactive"):
+        """Block until this caller may send a request of about ``tokens`` tokens"""
+        ticket = (PRIORITIES.get(priority, 0), next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        wait = self._wait_time(tokens, time.monotonic())
+                        if wait <= 0:
+                            self.requests.take(1)
+                            if self.tokens is not None and tokens:
+                                self.tokens.take(tokens)
+                            return
+                    else:
+                        wait = 1.0
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def release(self, tokens):
+        """Return over-reserved tokens once the real usage is known"""
+        if self.tokens is None or tokens <= 0:
+            return
+        with self._cond:
+            self.tokens.give_back(tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Hold every caller back for ``seconds``, e.g. after a 429"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+class RateLimitScheduler:
+    """One limiter per provider, shared by every job in the worker process"""
+
+    def __init__(self, limits=None):
+        limits = limits or {
+            "together": (TOGETHER_RPM, TOGETHER_TPM),
+            "cohere": (COHERE_RPM, COHERE_TPM)
+        }
+        self.limiters = {
+            provider: RateLimiter(rpm, tpm) for provider, (rpm, tpm) in limits.items()
+        }
+
+    def for_provider(self, provider):
+        return self.limiters.get(provider)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide provider rate limit scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler()
+        return _scheduler
+
+def set_scheduler(scheduler):
+    """Replace the process-wide scheduler, e.g. with unthrottled limits for a benchmark"""
+    global _scheduler
+    with _scheduler_lock:
+        previous, _scheduler = _scheduler, scheduler
+    return previous
+
+def retry_info(error):
+    """Classify a provider error as ``(retryable, status, retry_after_seconds)``"""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    headers = getattr(error, "headers", None)
+    response = getattr(error, "response", None)
+    if response is not None:
+        status = status or getattr(response, "status_code", None)
+        headers = headers or getattr(response, "headers", None)
+
+    retry_after = None
+    if headers:
+        try:
+            retry_after = float(headers.get("Retry-After") or headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+
+    if status is not None:
+        retryable = status in (408, 409, 429) or status >= 500
+    else:
+        name = type(error).__name__
+        retryable = (
+            isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError, ConnectionError))
+            or any(marker in name for marker in ("Timeout", "RateLimit", "APIConnection", "ServiceUnavailable"))
+        )
+    return retryable, status, retry_after
+
+def backoff_delay(attempt, retry_after=None, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_MAX):
+    """Full-jitter exponential backoff that never undercuts ``Retry-After``"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -1,77 +1,174 @@
-from together import Together
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+import json
 import os
+import re
+
+from agents.llm import LLM, parses
 
 load_dotenv()
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+# Concurrent research requests per job; candidates alternate between the
+# markdown and the JSON prompt and the first one that parses wins.
+RESEARCH_CANDIDATES = int(os.getenv("RESEARCH_CANDIDATES", "2"))
+
+TOPIC_LINE_RE = re.compile(r"^\s*(\d+)\.\s*\*\*(.+?)\*\*\s*[:–-]?\s*(.*)$")
+SELECTED_RE = re.compile(r"\*\*(.+?)\*\*\s*[:–-]?\s*(.*)", re.DOTALL)
 
 class ResearchAgent:
-    def __init__(self):
-        self.client = Together(api_key=TOGETHER_API_KEY)
+    def __init__(self, llm=None, candidates=RESEARCH_CANDIDATES):
+        self.llm = llm or LLM()
+        self.candidates = candidates
 
-    def research(self, topic="HR", year=2025, num_topics=5):
-        prompt = f"""
-You are an expert {topic} researcher tracking the latest trends.  
-Your task is to identify the top {num_topics} trending {topic} topics for {year} and provide a brief explanation (2-3 sentences) for each.  
+    def build_markdown_prompt(self, topic, year, num_topics):
+        return f"""
+You are an expert {topic} researcher tracking the latest trends.
+Your task is to identify the top {num_topics} trending {topic} topics for {year} and provide a brief explanation (2-3 sentences) for each.
 
-For each trend, highlight:  
-- Why it is gaining traction.  
-- Key developments or statistics.  
-- A real-world example if available.  
+For each trend, highlight:
+- Why it is gaining traction.
+- Key developments or statistics.
+- A real-world example if available.
 
-At the end, based on relevance and impact, **choose one topic** that would be the best focus for a detailed blog post.  
+At the end, based on relevance and impact, **choose one topic** that would be the best focus for a detailed blog post.
 
-Format the output as follows:  
+Format the output as follows:
 
-#### **Trending {topic} Topics in {year}**  
-1. **[Topic 1]**: [Brief explanation]  
-2. **[Topic 2]**: [Brief explanation]  
-3. **[Topic 3]**: [Brief explanation]  
-4. **[Topic 4]**: [Brief explanation]  
-5. **[Topic 5]**: [Brief explanation]  
+#### **Trending {topic} Topics in {year}**
+1. **[Topic 1]**: [Brief explanation]
+2. **[Topic 2]**: [Brief explanation]
+3. **[Topic 3]**: [Brief explanation]
+4. **[Topic 4]**: [Brief explanation]
+5. **[Topic 5]**: [Brief explanation]
 
-#### **Final Selected Topic:**  
-**[Chosen Topic]** – [Why this topic is the most relevant for a blog post]  
+#### **Final Selected Topic:**
+**[Chosen Topic]** – [Why this topic is the most relevant for a blog post]
 """
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=700,  
-            temperature=0.7 
-        )
-        
-        research_output = response.choices[0].message.content.strip()
-        
-        try:
-            if "#### **Final Selected Topic:**" in research_output:
-                topics_section, final_topic_section = research_output.split("#### **Final Selected Topic:**")
-            else:
-                sections = research_output.split("####")
-                topics_section = sections[1]  
-                final_topic_section = sections[2]  
-            
-            topics = []
-            for line in topics_section.strip().split("\n"):
-                if line.startswith(str(len(topics) + 1) + "."):
-                    topic_text = line.split("**: ", 1)[1]
-                    topics.append({
-                        "topic": line.split("**")[1],  
-                        "details": topic_text
-                    })
+    def build_json_prompt(self, topic, year, num_topics):
+        return f"""
+You are an expert {topic} researcher tracking the latest trends.
+Identify the top {num_topics} trending {topic} topics for {year}. For each one, give a brief explanation (2-3 sentences) covering why it is gaining traction, key developments or statistics, and a real-world example if available.
+Then, based on relevance and impact, choose the one topic that would be the best focus for a detailed blog post.
 
+Return ONLY a JSON object in this exact format:
+{{
+    "trending_topics": [
+        {{"topic": "Topic 1", "details": "Brief explanation"}}
+    ],
+    "selected_topic": "Chosen Topic",
+    "selected_topic_details": "Why this topic is the most relevant for a blog post"
+}}
+"""
+
+    def parse_markdown(self, research_output):
+        """Parse the markdown research format, raising ValueError when it does not fit"""
+        if "Final Selected Topic" in research_output:
+            topics_section, final_topic_section = research_output.split("Final Selected Topic", 1)
+            final_topic_section = final_topic_section.lstrip(":* \n")
+        else:
+            sections = research_output.split("####")
+            if len(sections) < 3:
+                raise ValueError("Missing topic list or selected topic")
+            topics_section, final_topic_section = sections[1], sections[2]
+
+        topics = []
+        for line in topics_section.strip().split("\n"):
+            match = TOPIC_LINE_RE.match(line)
+            if match and int(match.group(1)) == len(topics) + 1:
+                topics.append({
+                    "topic": match.group(2).strip().rstrip(":"),
+                    "details": match.group(3).strip()
+                })
+
+        match = SELECTED_RE.search(final_topic_section)
+        if match:
+            selected_topic, selected_topic_details = match.group(1).strip().rstrip(":"), match.group(2).strip()
+        else:
             final_parts = final_topic_section.strip().split(" – ", 1)
-            selected_topic = final_parts[0].strip().strip('**')
+            selected_topic = final_parts[0].strip().strip("*")
             selected_topic_details = final_parts[1].strip() if len(final_parts) > 1 else ""
 
-            return {
-                "trending_topics": topics,
-                "selected_topic": selected_topic,
-                "selected_topic_details": selected_topic_details
-            }
+        return {
+            "trending_topics": topics,
+            "selected_topic": selected_topic,
+            "selected_topic_details": selected_topic_details
+        }
+
+    def parse_json(self, research_output):
+        json_match = re.search(r"\{.*\}", research_output, re.DOTALL)
+        if not json_match:
+            raise ValueError("No JSON object in response")
+        data = json.loads(json_match.group())
+        return {
+            "trending_topics": [
+                {"topic": str(item["topic"]).strip(), "details": str(item.get("details", "")).strip()}
+                for item in data.get("trending_topics", [])
+            ],
+            "selected_topic": str(data.get("selected_topic", "")).strip(),
+            "selected_topic_details": str(data.get("selected_topic_details", "")).strip()
+        }
+
+    def validate(self, research):
+        if not research["trending_topics"]:
+            raise ValueError("No trending topics found")
+        if not research["selected_topic"] or research["selected_topic"].startswith("["):
+            raise ValueError("No selected topic found")
+        return research
+
+    def research_candidate(self, index, topic, year, num_topics):
+        """Run one research request and return ``(parsed_or_None, raw_output)``"""
+        if index % 2 == 0:
+            prompt, parse, max_tokens = self.build_markdown_prompt(topic, year, num_topics), self.parse_markdown, 700
+        else:
+            prompt, parse, max_tokens = self.build_json_prompt(topic, year, num_topics), self.parse_json, 900
+        # Later candidates sample a little cooler so they do not repeat earlier ones.
+        temperature = round(max(0.3, 0.7 - 0.1 * (index // 2)), 2)
+
+        research_output = self.llm.chat(
+            prompt, max_tokens=max_tokens, temperature=temperature, task="research.research",
+            cacheable=parses(lambda text: self.validate(parse(text)))
+        )
+        try:
+            return self.validate(parse(research_output)), research_output
         except Exception as e:
-            print(f"Parsing error: {str(e)}")
-            return {
-                "error": "Failed to parse response",
-                "raw_output": research_output
-            }
+            print(f"Parsing error in research candidate {index}: {str(e)}")
+            return None, research_output
+
+    def research(self, topic="HR", year=2025, num_topics=5):
+        """Find trending topics and select one, racing several candidate requests
+
+        The first candidate that parses into a valid topic list and selected
+        topic is returned right away; candidates that have not started are
+        cancelled and running ones are left to finish in the background.
+        """
+        candidates = max(1, self.candidates)
+        pool = ThreadPoolExecutor(max_workers=candidates, thread_name_prefix="research-candidate")
+        pending = {
+            pool.submit(self.research_candidate, index, topic, year, num_topics)
+            for index in range(candidates)
+        }
+        raw_outputs, errors = [], []
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Look at every finished candidate before giving up, so a
+                # failure does not hide a valid answer that finished with it.
+                for future in done:
+                    try:
+                        research, raw_output = future.result()
+                    except Exception as e:
+                        print(f"Research candidate failed: {str(e)}")
+                        errors.append(e)
+                        continue
+                    if research is not None:
+                        return research
+                    raw_outputs.append(raw_output)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if not raw_outputs:
+            raise errors[0]
+        return {
+            "error": "Failed to parse response",
+            "raw_output": "\n\n---\n\n".join(raw_outputs)
+        }
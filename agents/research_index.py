@@ -0,0 +1,194 @@
+from dotenv import load_dotenv
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from agents.seo_analytics import STOPWORDS
+
+load_dotenv()
+RESEARCH_INDEX_ENABLED = os.getenv("RESEARCH_INDEX_ENABLED", "true").lower() == "true"
+RESEARCH_INDEX_PATH = os.getenv("RESEARCH_INDEX_PATH", os.path.join(".cache", "research_index.sqlite"))
+RESEARCH_SIMILARITY_THRESHOLD = float(os.getenv("RESEARCH_SIMILARITY_THRESHOLD", "0.85"))
+# Research is about what is trending, so it is only reused while fresh.
+RESEARCH_FRESHNESS = int(os.getenv("RESEARCH_FRESHNESS", str(3 * 24 * 3600)))
+RESEARCH_INDEX_SCAN = int(os.getenv("RESEARCH_INDEX_SCAN", "500"))
+
+HASH_BUCKETS = 2 ** 18
+
+# Spellings that mean the same thing are folded onto one form.
+SYNONYMS = {
+    "artificial intelligence": "ai",
+    "machine learning": "ml",
+    "human resources": "hr",
+    "health care": "healthcare",
+    "large language models": "llm",
+    "large language model": "llm",
+    "llms": "llm"
+}
+# Words editors add to a topic that do not change what the research is about.
+FILLER_WORDS = frozenset({"trend", "trends", "trending", "latest", "top", "emerging", "current", "today", "upcoming", "key"})
+# Kept even though they are stopwords: "Healthcare without AI" is not "AI in Healthcare".
+NEGATION_WORDS = frozenset({"not", "no", "nor", "without", "against", "never", "non", "anti"})
+YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+def normalize_topic(topic):
+    """Reduce a topic to its content words, e.g. "Healthcare AI trends 2025" -> "ai healthcare" """
+    # Hyphenated words are joined first: "well-being", "e-commerce".
+    text = NON_WORD_RE.sub(" ", YEAR_RE.sub(" ", (topic or "").lower().replace("-", "")))
+    text = f" {' '.join(text.split())} "
+    for phrase, replacement in SYNONYMS.items():
+        text = text.replace(f" {phrase} ", f" {replacement} ")
+
+    words = []
+    for word in text.split():
+        if (word in STOPWORDS and word not in NEGATION_WORDS) or word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(sorted(set(words)))
+
+def negations(normalized):
+    return set(normalized.split()) & NEGATION_WORDS
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode("utf-8")) % HASH_BUCKETS
+
+def topic_vector(normalized):
+    """Hashing-vectorizer features of a normalized topic, L2-normalized
+
+    Whole words carry most of the weight; character trigrams give partial
+    credit to close spellings ("remote work" / "remote working").
+    """
+    vector = {}
+    for word in normalized.split():
+        bucket = _bucket(f"w:{word}")
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    joined = f"#{normalized.replace(' ', '')}#"
+    for start in range(len(joined) - 2):
+        bucket = _bucket(f"c:{joined[start:start + 3]}")
+        vector[bucket] = vector.get(bucket, 0.0) + 0.25
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+    return {bucket: weight / norm for bucket, weight in vector.items()}
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(bucket, 0.0) for bucket, weight in a.items())
+
+class ResearchIndex:
+    """Past research and outlines, looked up by topic similarity
+
+    Lets near-duplicate topics ("AI in Healthcare", "healthcare AI trends")
+    reuse the research and outline of a recent run instead of making cold
+    research and planning calls. Entries only match for the same year and
+    number of topics, and only within ``freshness`` seconds.
+    """
+
+    def __init__(self, path=RESEARCH_INDEX_PATH, threshold=RESEARCH_SIMILARITY_THRESHOLD,
+                 freshness=RESEARCH_FRESHNESS, scan=RESEARCH_INDEX_SCAN):
+        self.path = path
+        self.threshold = threshold
+        self.freshness = freshness
+        self.scan = scan
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS research_index (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                vector TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                num_topics INTEGER NOT NULL,
+                research TEXT NOT NULL,
+                outline TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, topic, year, num_topics):
+        """Return the most similar fresh entry above the threshold, or None"""
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return None
+        vector = topic_vector(normalized)
+        negated = negations(normalized)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT topic, normalized, vector, research, outline, created_at FROM research_index "
+                "WHERE year = ? AND num_topics = ? AND created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (year, num_topics, now - self.freshness, self.scan)
+            ).fetchall()
+
+        best, best_similarity = None, self.threshold
+        for past_topic, past_normalized, past_vector, research, outline, created_at in rows:
+            # Topics that negate different things never match, however many
+            # words they share. Older entries dropped negations, so re-derive them.
+            if negations(normalize_topic(past_topic)) != negated:
+                continue
+            if past_normalized == normalized:
+                similarity = 1.0
+            else:
+                similarity = cosine(vector, {int(bucket): weight for bucket, weight in json.loads(past_vector).items()})
+            if similarity >= best_similarity and (best is None or similarity > best["similarity"]):
+                best, best_similarity = {
+                    "topic": past_topic,
+                    "similarity": round(similarity, 4),
+                    "research": json.loads(research),
+                    "outline": outline,
+                    "age": round(now - created_at, 1)
+                }, similarity
+        return best
+
+    def add(self, topic, year, num_topics, research, outline=None):
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO research_index (topic, normalized, vector, year, num_topics, research, outline, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (topic, normalized, json.dumps(topic_vector(normalized)), year, num_topics,
+                 json.dumps(research, ensure_ascii=False), outline, now)
+            )
+            self._conn.execute("DELETE FROM research_index WHERE created_at < ?", (now - self.freshness,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM research_index")
+            self._conn.commit()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_research_index():
+    """Return the process-wide research index, or None when it is disabled"""
+    global _index
+    if not RESEARCH_INDEX_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = ResearchIndex()
+            except sqlite3.Error as e:
+                print(f"Research index unavailable: {str(e)}")
+                return None
+        return _index
@@ -1,18 +1,56 @@
-from together import Together
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
 import json
+import time
+
+from agents.compaction import document_digest, headings_digest
+from agents.llm import LLM, estimate_tokens, parses
+from agents.metrics import stage_history
+from agents.markdown_utils import (
+    has_body, is_toc_section, join_sections, normalize_markdown, section_heading, split_sections
+)
+from agents.section_memo import memoized
+from agents.task_graph import run_task_graph
 
 load_dotenv()
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+# "full" runs the original four LLM passes, with the suggestions alongside
+# the final check; "fast" fixes structure locally and polishes each section
+# in one pass, trading some polish for far fewer tokens.
+REVIEW_MODE = os.getenv("REVIEW_MODE", "full")
+REVIEW_MAX_CONCURRENCY = int(os.getenv("REVIEW_MAX_CONCURRENCY", "4"))
+# Full mode reviews longer posts section by section so no pass hits its
+# 3000-token output cap.
+REVIEW_CHUNK_TOKENS = int(os.getenv("REVIEW_CHUNK_TOKENS", "1500"))
 
 class ReviewAgent:
-    def __init__(self):
-        self.client = Together(api_key=TOGETHER_API_KEY)
+    def __init__(self, llm=None, mode=REVIEW_MODE, max_concurrency=REVIEW_MAX_CONCURRENCY, chunk_tokens=REVIEW_CHUNK_TOKENS,
+                 memo=None):
+        self.llm = llm or LLM()
+        self.mode = mode
+        self.max_concurrency = max_concurrency
+        self.chunk_tokens = chunk_tokens
+        # With a SectionMemo, sections unchanged since the last run keep
+        # their earlier review.
+        self.memo = memo
+
+    def build_structure_prompt(self, content, headings=None):
+        if headings is not None:
+            return f"""
+        Review and fix the markdown structure of one section of a blog post. Return ONLY the corrected markdown for this section with:
+        1. Its heading kept as it is, and H3 headings for any subsections
+        2. Consistent formatting for lists and bullet points
+        3. Proper spacing between paragraphs
+        4. Correct markdown syntax for links and emphasis
+        Do not add a title, an introduction, a conclusion or a table of contents.
+
+        The full post has these sections:
+        {headings}
 
-    def check_markdown_structure(self, content):
-        """Verify and fix markdown structure"""
-        structure_prompt = f"""
+        Section to review:
+        {content}
+        """
+        return f"""
         Review and fix the markdown structure of this blog post. Return ONLY the corrected markdown content with:
         1. Proper heading hierarchy (H1 > H2 > H3)
         2. Consistent formatting for lists and bullet points
@@ -24,18 +62,36 @@ class ReviewAgent:
         {content}
         """
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": structure_prompt}],
-            max_tokens=3000,
-            temperature=0.3
-        )
-        
-        return response.choices[0].message.content.strip()
+    def check_markdown_structure(self, content, headings=None):
+        """Verify and fix markdown structure
+
+        With ``headings``, the list of the post's sections, ``content`` is a
+        single section and gets the section-scoped prompt.
+        """
+        structure_prompt = self.build_structure_prompt(content, headings)
+
+        return self.llm.chat(structure_prompt, max_tokens=3000, temperature=0.3, task="review.check_markdown_structure")
 
-    def enhance_content_quality(self, content):
-        """Improve content quality and readability"""
-        quality_prompt = f"""
+    def build_enhance_prompt(self, content, headings=None):
+        if headings is not None:
+            return f"""
+        Enhance the quality of one section of a blog post. Focus on:
+        1. Clarity and conciseness
+        2. Professional tone
+        3. Engaging transitions into the surrounding sections
+        4. Active voice
+        5. Industry-specific terminology
+        6. Data-backed statements
+        7. Actionable insights
+        Keep the section heading. Return ONLY the section, without a title, an introduction, a conclusion or a table of contents.
+
+        The full post has these sections:
+        {headings}
+
+        Section to enhance:
+        {content}
+        """
+        return f"""
         Enhance this blog post's quality. Focus on:
         1. Clarity and conciseness
         2. Professional tone
@@ -49,18 +105,16 @@ class ReviewAgent:
         {content}
         """
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": quality_prompt}],
-            max_tokens=3000,
-            temperature=0.4
-        )
-        
-        return response.choices[0].message.content.strip()
+    def enhance_content_quality(self, content, headings=None):
+        """Improve content quality and readability, of one section when ``headings`` is given"""
+        quality_prompt = self.build_enhance_prompt(content, headings)
 
-    def generate_improvement_suggestions(self, content):
-        """Generate suggestions for further improvements"""
-        suggestion_prompt = f"""
+        return self.llm.chat(quality_prompt, max_tokens=3000, temperature=0.4, task="review.enhance_content_quality")
+
+    def build_suggestion_prompt(self, content, digest=False):
+        if digest:
+            content = f"(Headings and the opening paragraph of each section)\n{content}"
+        return f"""
         Analyze this blog post and provide specific suggestions for improvement in JSON format:
         {{
             "content_suggestions": [
@@ -84,15 +138,21 @@ class ReviewAgent:
         {content}
         """
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": suggestion_prompt}],
-            max_tokens=1000,
-            temperature=0.4
+    def generate_improvement_suggestions(self, content, digest=False):
+        """Generate suggestions for further improvements
+
+        With ``digest`` the content is a ``document_digest`` of the post
+        rather than the full text.
+        """
+        suggestion_prompt = self.build_suggestion_prompt(content, digest=digest)
+
+        response = self.llm.chat(
+            suggestion_prompt, max_tokens=1000, temperature=0.4, task="review.generate_improvement_suggestions",
+            cacheable=parses(json.loads)
         )
 
         try:
-            return json.loads(response.choices[0].message.content.strip())
+            return json.loads(response)
         except json.JSONDecodeError:
             return {
                 "content_suggestions": ["Review content structure", "Add more examples"],
@@ -100,83 +160,329 @@ class ReviewAgent:
                 "engagement_suggestions": ["Include call-to-actions", "Add reader questions"]
             }
 
-    def read_blog_content(self, filename="seo_optimized_blog.md"):
+    def read_blog_content(self, filename="seo_optimized_blog.md", output_dir="output"):
         """Read blog content from the output directory"""
         try:
-            filepath = os.path.join("output", filename)
+            filepath = os.path.join(output_dir, filename)
             with open(filepath, "r") as f:
                 return f.read()
         except Exception as e:
             print(f"Error reading blog content: {str(e)}")
             return None
 
-    def save_review_outputs(self, review_output):
+    def save_review_outputs(self, review_output, output_dir="output"):
         """Save all review-related outputs to files"""
         try:
-            os.makedirs("output", exist_ok=True)
+            os.makedirs(output_dir, exist_ok=True)
             
-            with open("output/final_blog.md", "w") as f:
-                f.write(review_output["final_content"])
+            with open(os.path.join(output_dir, "final_blog.md"), "w") as f:
+                f.write(review_output["final_content"] or "")
             
-            with open("output/improvement_suggestions.json", "w") as f:
+            with open(os.path.join(output_dir, "improvement_suggestions.json"), "w") as f:
                 json.dump(review_output["improvement_suggestions"], f, indent=2)
             
-            print("Review outputs saved successfully to output directory")
+            print(f"Review outputs saved successfully to {output_dir}")
             return True
         except Exception as e:
             print(f"Error saving review outputs: {str(e)}")
             return False
 
-    def final_review(self, blog_content=None):
-        """Perform final review and enhancement of the blog post"""
+    def build_final_check_prompt(self, content, headings=None):
+        if headings is not None:
+            return f"""
+        Perform a final quality check on one section of a blog post. Return ONLY the final section content without any additional commentary or notes.
+        Ensure:
+        1. The section connects to the sections around it
+        2. No redundant information
+        3. Clear and professional tone throughout
+        4. Proper formatting, keeping the section heading
+        5. SEO elements are well-integrated
+        6. No review comments or notes in the output
+        Do not add a title, an introduction, a conclusion or a table of contents.
+
+        The full post has these sections:
+        {headings}
+
+        Section to review:
+        {content}
+        """
+        return f"""
+        Perform a final quality check on this blog post. Return ONLY the final blog content without any additional commentary or notes.
+        Ensure:
+        1. All sections are properly connected
+        2. No redundant information
+        3. Clear and professional tone throughout
+        4. Proper formatting and structure
+        5. SEO elements are well-integrated
+        6. No review comments or notes in the output
+        
+        Content:
+        {content}
+        """
+
+    def strip_commentary(self, content):
+        """Drop reviewer preambles and change notes the model adds around the content"""
+        if "After conducting a thorough review" in content:
+            content = content.split("\n\n", 1)[1]
+
+        if "I made the following adjustments:" in content:
+            content = content.split("I made the following adjustments:")[0].strip()
+
+        return content
+
+    def final_quality_check(self, content, on_delta=None, headings=None):
+        """Run the last polish pass and strip any reviewer commentary
+
+        With ``headings`` the pass checks the single section in ``content``.
+        """
+        final_check_prompt = self.build_final_check_prompt(content, headings)
+
+        on_token = None
+        if on_delta is not None:
+            def on_token(text):
+                on_delta({"text": text})
+
+        final_content = self.llm.chat(
+            final_check_prompt, max_tokens=3000, temperature=0.3, on_token=on_token, task="review.final_quality_check"
+        )
+
+        return self.strip_commentary(final_content)
+
+    def build_polish_prompt(self, section, headings):
+        return f"""
+        Enhance and finalize one section of a blog post. Focus on:
+        1. Clarity and conciseness
+        2. Professional tone and active voice
+        3. Smooth transitions into the surrounding sections
+        4. Industry-specific terminology and data-backed statements
+        5. Actionable insights
+        6. Proper markdown formatting
+        Keep the section heading. Return ONLY the section content without any additional commentary or notes.
+
+        The full post has these sections:
+        {headings}
+
+        Section to enhance:
+        {section}
+        """
+
+    def polish_section(self, section, headings, on_delta=None):
+        """Enhance and final-check a single section in one call"""
+        polish_prompt = self.build_polish_prompt(section, headings)
+        max_tokens = min(3000, 2 * estimate_tokens(section) + 300)
+
+        on_token = None
+        if on_delta is not None:
+            def on_token(text):
+                on_delta({"text": text})
+
+        return self.strip_commentary(self.llm.chat(
+            polish_prompt, max_tokens=max_tokens, temperature=0.4, on_token=on_token, task="review.polish_section"
+        ))
+
+    def process_sections(self, chunks, func, on_delta=None, kind=None):
+        """Run ``func(chunk, on_delta)`` on every section concurrently, in document order
+
+        The table of contents and heading-only chunks are passed through, as
+        the TOC is regenerated once the sections are stitched back. Streamed
+        payloads are tagged with the section index and heading. With a memo,
+        results are memoized per section under ``kind``.
+        """
+        def process(item):
+            index, chunk = item
+            if is_toc_section(chunk) or not has_body(chunk):
+                return chunk
+
+            heading = section_heading(chunk)
+            section_delta = None
+            if on_delta is not None:
+                def section_delta(payload):
+                    on_delta({"section": index, "heading": heading, **payload})
+
+            if kind is None:
+                result = func(chunk, section_delta)
+            else:
+                # Memoized sections were not streamed; send them whole.
+                result = memoized(
+                    self.memo, kind, lambda: func(chunk, section_delta), chunk,
+                    on_hit=lambda text: section_delta({"text": text}) if section_delta is not None else None
+                )
+            if heading and section_heading(result) is None:
+                result = f"{heading}\n\n{result}"
+            return result
+
+        max_workers = max(1, min(self.max_concurrency, len(chunks)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="review-section") as pool:
+            return list(pool.map(process, enumerate(chunks)))
+
+    def review_chunked(self, blog_content, on_delta=None):
+        """Run the four full-mode passes section by section
+
+        Every pass except the suggestions works on one ``##`` section at a
+        time, so long posts are never cut off at the output cap, and the
+        sections of each pass run concurrently.
+        """
+        timings = {}
+
+        # Each section gets the section-scoped prompts, with the post's
+        # headings as context, so no pass adds a title or TOC to a section.
+        def timed_pass(name, func, content, on_delta=None):
+            started = time.perf_counter()
+            chunks = split_sections(content)
+            headings = headings_digest(chunks)
+            result = join_sections(self.process_sections(
+                chunks, lambda chunk, section_delta: func(chunk, headings, section_delta),
+                on_delta=on_delta, kind=f"review.{name}"
+            ))
+            timings[name] = round(time.perf_counter() - started, 3)
+            return result
+
+        structured_content = timed_pass(
+            "structure", lambda chunk, headings, _: self.check_markdown_structure(chunk, headings), blog_content
+        )
+        enhanced_content = timed_pass(
+            "enhance", lambda chunk, headings, _: self.enhance_content_quality(chunk, headings), structured_content
+        )
+
+        # The suggestions only read the enhanced post, so they run alongside the final check.
+        tasks = {
+            "suggestions": (lambda _: memoized(
+                self.memo, "review.suggestions", lambda: self.generate_improvement_suggestions(enhanced_content),
+                headings_digest(split_sections(enhanced_content))
+            ), []),
+            "final_check": (lambda _: timed_pass(
+                "final_check",
+                lambda chunk, headings, section_delta: self.final_quality_check(
+                    chunk, on_delta=section_delta, headings=headings
+                ),
+                enhanced_content,
+                on_delta=on_delta
+            ), [])
+        }
+        results, graph_timings = run_task_graph(tasks)
+        timings.update(graph_timings)
+
+        return results["final_check"], results["suggestions"], timings, None
+
+    def review_sequential(self, blog_content, on_delta=None):
+        """Run the four review passes, the suggestions alongside the final check"""
+        if estimate_tokens(blog_content) > self.chunk_tokens:
+            return self.review_chunked(blog_content, on_delta)
+
+        tasks = {
+            "structure": (lambda _: self.check_markdown_structure(blog_content), []),
+            "enhance": (lambda deps: self.enhance_content_quality(deps["structure"]), ["structure"]),
+            "suggestions": (lambda deps: self.generate_improvement_suggestions(deps["enhance"]), ["enhance"]),
+            "final_check": (
+                lambda deps: self.final_quality_check(deps["enhance"], on_delta=on_delta), ["enhance"]
+            )
+        }
+        results, timings = run_task_graph(tasks)
+
+        return results["final_check"], results["suggestions"], timings, None
+
+    def review_fast(self, blog_content, on_delta=None):
+        """Fix structure locally and polish each section in a single pass
+
+        Instead of sending the whole post to the enhance, suggestion and
+        final check passes, each section is enhanced and final-checked in one
+        call with only the list of headings as context, and suggestions are
+        drawn from a digest of the post. Both run concurrently.
+        """
+        started = time.perf_counter()
+        structured_content = normalize_markdown(blog_content)
+        chunks = split_sections(structured_content)
+        digest = document_digest(chunks)
+        timings = {"structure": round(time.perf_counter() - started, 3)}
+
+        headings = headings_digest(chunks)
+        section_seconds = []
+
+        def polish(chunk, section_delta):
+            polish_started = time.perf_counter()
+            text = self.polish_section(chunk, headings, section_delta)
+            section_seconds.append(time.perf_counter() - polish_started)
+            return text
+
+        tasks = {
+            "polish": (lambda _: self.process_sections(chunks, polish, on_delta, kind="review.polish"), []),
+            # Suggestions are about the post as a whole; they are only redone
+            # when its sections change, not when one section's body does.
+            "suggestions": (lambda _: memoized(
+                self.memo, "review.suggestions", lambda: self.generate_improvement_suggestions(digest, digest=True),
+                headings
+            ), [])
+        }
+        results, graph_timings = run_task_graph(tasks)
+        timings.update(graph_timings)
+
+        final_content = join_sections(results["polish"])
+
+        # Compare against the prompts the sequential review would have sent.
+        baseline_tokens = sum(estimate_tokens(prompt) for prompt in (
+            self.build_structure_prompt(blog_content),
+            self.build_enhance_prompt(structured_content),
+            self.build_suggestion_prompt(structured_content),
+            self.build_final_check_prompt(structured_content)
+        ))
+        prompt_tokens = estimate_tokens(self.build_suggestion_prompt(digest, digest=True)) + sum(
+            estimate_tokens(self.build_polish_prompt(chunk, headings))
+            for chunk in chunks if has_body(chunk) and not is_toc_section(chunk)
+        )
+        # Full mode generates the post three times over in sequence (structure,
+        # enhance, final check). Its recent run times are the baseline when
+        # there are enough of them; otherwise the summed section polish times
+        # stand in for generating the post once.
+        elapsed = time.perf_counter() - started
+        baseline_seconds = stage_history.median("review.full")
+        wall_time_basis = "history"
+        if baseline_seconds is None:
+            baseline_seconds = 3 * sum(section_seconds)
+            wall_time_basis = "estimate"
+        savings = {
+            "full_document_passes_saved": 3,
+            "baseline_prompt_tokens": baseline_tokens,
+            "prompt_tokens": prompt_tokens,
+            "estimated_tokens_saved": max(0, baseline_tokens - prompt_tokens),
+            "wall_time_saved": round(max(0.0, baseline_seconds - elapsed), 3),
+            "wall_time_basis": wall_time_basis
+        }
+        self.llm.record_savings("review.final_review", savings["estimated_tokens_saved"])
+
+        return final_content, results["suggestions"], timings, savings
+
+    def final_review(self, blog_content=None, on_delta=None):
+        """Perform final review and enhancement of the blog post
+
+        ``on_delta`` optionally receives streamed text payloads: ``{"text"}``
+        from the final quality check of a short post in full mode, and
+        ``{"section", "heading", "text"}`` when sections are processed
+        separately.
+        """
         try:
             if blog_content is None:
                 blog_content = self.read_blog_content()
                 if blog_content is None:
                     raise ValueError("No blog content provided or found in output directory")
 
-            structured_content = self.check_markdown_structure(blog_content)
-            
-            enhanced_content = self.enhance_content_quality(structured_content)
-            
-            suggestions = self.generate_improvement_suggestions(enhanced_content)
-            
-            final_check_prompt = f"""
-            Perform a final quality check on this blog post. Return ONLY the final blog content without any additional commentary or notes.
-            Ensure:
-            1. All sections are properly connected
-            2. No redundant information
-            3. Clear and professional tone throughout
-            4. Proper formatting and structure
-            5. SEO elements are well-integrated
-            6. No review comments or notes in the output
-            
-            Content:
-            {enhanced_content}
-            """
-
-            final_response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=[{"role": "user", "content": final_check_prompt}],
-                max_tokens=3000,
-                temperature=0.3
-            )
-
-            final_content = final_response.choices[0].message.content.strip()
-
-            if "After conducting a thorough review" in final_content:
-                final_content = final_content.split("\n\n", 1)[1]
-            
-            if "I made the following adjustments:" in final_content:
-                final_content = final_content.split("I made the following adjustments:")[0].strip()
+            started = time.perf_counter()
+            if self.mode == "full":
+                final_content, suggestions, timings, savings = self.review_sequential(blog_content, on_delta)
+            else:
+                final_content, suggestions, timings, savings = self.review_fast(blog_content, on_delta)
+            timings["total"] = round(time.perf_counter() - started, 3)
+            if self.mode == "full":
+                stage_history.record("review.full", timings["total"])
 
             review_output = {
                 "final_content": final_content,
                 "improvement_suggestions": suggestions,
-                "status": "success"
+                "status": "success",
+                "mode": self.mode,
+                "timings": timings
             }
-
-            self.save_review_outputs(review_output)
+            if savings is not None:
+                review_output["savings"] = savings
 
             return review_output
 
@@ -192,7 +498,4 @@ class ReviewAgent:
                 "error": str(e)
             }
             
-            self.save_review_outputs(error_output)
-            
             return error_output
-
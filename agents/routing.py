@@ -0,0 +1,186 @@
+from collections import deque
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+from agents.metrics import record_model_fallback
+
+load_dotenv()
+MODEL_LARGE = os.getenv("MODEL_LARGE", "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free")
+MODEL_FAST = os.getenv("MODEL_FAST", "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo")
+# Comma-separated "task=tier" overrides, e.g. "seo.generate_schema=large".
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "20"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "4"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_SLOW_FACTOR = float(os.getenv("ROUTER_SLOW_FACTOR", "2.5"))
+ROUTER_MAX_INFLIGHT = int(os.getenv("ROUTER_MAX_INFLIGHT", "16"))
+ROUTER_PROBE_INTERVAL = float(os.getenv("ROUTER_PROBE_INTERVAL", "30"))
+
+# Models in order of preference; later ones are the fallbacks.
+TIERS = {
+    "large": [MODEL_LARGE, MODEL_FAST],
+    "fast": [MODEL_FAST, MODEL_LARGE]
+}
+
+# Long-form prose stays on the large model; short structured calls go fast.
+DEFAULT_ROUTES = {
+    "research.research": "large",
+    "content.generate_section": "large",
+    "seo.rewrite_content": "large",
+    "seo.rewrite_section": "large",
+    "seo.analyze_keywords": "fast",
+    "seo.generate_schema": "fast",
+    "review.check_markdown_structure": "large",
+    "review.enhance_content_quality": "large",
+    "review.generate_improvement_suggestions": "fast",
+    "review.final_quality_check": "large",
+    "review.polish_section": "large"
+}
+
+def parse_routes(spec):
+    """Parse "task=tier,task=tier" into a dict, ignoring malformed entries"""
+    routes = {}
+    for entry in spec.split(","):
+        task, _, tier = entry.partition("=")
+        if task.strip() and tier.strip():
+            routes[task.strip()] = tier.strip()
+    return routes
+
+class ModelStats:
+    """Recent outcomes and per-token latency of one model"""
+
+    def __init__(self, window=ROUTER_WINDOW):
+        self.outcomes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.baseline = None
+        self.inflight = 0
+        self.last_probe = 0.0
+
+    def record(self, seconds, completion_tokens, error):
+        self.outcomes.append(not error)
+        if error:
+            return
+        # Per output token, so a 3000-token rewrite and a 200-token JSON
+        # answer are comparable.
+        latency = seconds / max(1, completion_tokens)
+        self.latencies.append(latency)
+        self.baseline = latency if self.baseline is None else 0.95 * self.baseline + 0.05 * latency
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def recent_latency(self, samples):
+        recent = sorted(list(self.latencies)[-samples:])
+        return recent[len(recent) // 2] if recent else None
+
+class ModelRouter:
+    """Pick a model for each agent task and fall back when it is unhealthy
+
+    Each task maps to a tier, and each tier to models in order of preference.
+    A model is skipped while it is saturated (too many calls in flight),
+    failing (recent error rate above the limit) or slow (recent per-token
+    latency well above its own long-run average). Skipped models get a probe
+    call every ``probe_interval`` seconds so the router notices recovery.
+    """
+
+    def __init__(self, routes=None, tiers=None, default_tier="large", min_samples=ROUTER_MIN_SAMPLES,
+                 max_error_rate=ROUTER_MAX_ERROR_RATE, slow_factor=ROUTER_SLOW_FACTOR,
+                 max_inflight=ROUTER_MAX_INFLIGHT, probe_interval=ROUTER_PROBE_INTERVAL):
+        self.routes = routes if routes is not None else {**DEFAULT_ROUTES, **parse_routes(MODEL_ROUTES)}
+        self.tiers = tiers or TIERS
+        self.default_tier = default_tier
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.slow_factor = slow_factor
+        self.max_inflight = max_inflight
+        self.probe_interval = probe_interval
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model):
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def candidates(self, task):
+        tier = self.routes.get(task, self.default_tier)
+        return self.tiers.get(tier) or self.tiers[self.default_tier]
+
+    def _health(self, stats):
+        """Return why a model should be skipped, or None when it is healthy"""
+        if self.max_inflight and stats.inflight >= self.max_inflight:
+            return "saturated"
+        if len(stats.outcomes) >= self.min_samples and stats.error_rate() > self.max_error_rate:
+            return "errors"
+        if len(stats.latencies) >= self.min_samples:
+            recent = stats.recent_latency(self.min_samples)
+            if recent > self.slow_factor * stats.baseline:
+                return "slow"
+        return None
+
+    def choose(self, task, avoid=()):
+        """Return the model to use for ``task``, skipping models in ``avoid``"""
+        candidates = [model for model in self.candidates(task) if model not in avoid] or self.candidates(task)
+        now = time.monotonic()
+        with self._lock:
+            reasons = []
+            for model in candidates:
+                stats = self._stats(model)
+                reason = self._health(stats)
+                if reason is None:
+                    break
+                # Let one call through now and then so a recovered model is noticed.
+                if reason != "saturated" and now - stats.last_probe >= self.probe_interval:
+                    stats.last_probe = now
+                    break
+                reasons.append(reason)
+            else:
+                model, reasons = candidates[0], []
+                stats = self._stats(model)
+            stats.inflight += 1
+
+        if reasons:
+            record_model_fallback(task, candidates[0], model, reasons[0])
+        return model
+
+    def finish(self, model, seconds, completion_tokens=0, error=False):
+        """Record the outcome of a call made with a model from ``choose``"""
+        with self._lock:
+            stats = self._stats(model)
+            stats.inflight = max(0, stats.inflight - 1)
+            stats.record(seconds, completion_tokens, error)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: {
+                    "inflight": stats.inflight,
+                    "error_rate": round(stats.error_rate(), 3),
+                    "ms_per_token": round(1000 * (stats.recent_latency(self.min_samples) or 0), 2),
+                    "baseline_ms_per_token": round(1000 * (stats.baseline or 0), 2),
+                    "health": self._health(stats) or "ok"
+                }
+                for model, stats in self.stats.items()
+            }
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """Return the process-wide model router"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
+
+def set_router(router):
+    """Replace the process-wide router, e.g. with fixed routes for a benchmark"""
+    global _router
+    with _router_lock:
+        previous, _router = _router, router
+    return previous
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+
+class SectionMemo:
+    """Per-job section outputs keyed by a content hash of their inputs
+
+    Agents look a section up before calling the model and store what they
+    produce, so a rerun after an outline edit only regenerates the sections
+    whose inputs changed. Kinds are named ``"<stage>.<what>"``;
+    ``snapshot`` drops the entries of a stage that this run recomputed but
+    did not use, so a job's memo does not grow with every edit.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, kind, *inputs):
+        payload = json.dumps([kind, *inputs], sort_keys=True, ensure_ascii=False)
+        return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def has(self, kind, *inputs):
+        with self._lock:
+            return self.key(kind, *inputs) in self.entries
+
+    def get(self, kind, *inputs):
+        key = self.key(kind, *inputs)
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.used.add(key)
+            return value
+
+    def put(self, kind, value, *inputs):
+        key = self.key(kind, *inputs)
+        with self._lock:
+            self.entries[key] = value
+            self.used.add(key)
+        return value
+
+    def snapshot(self):
+        """Entries worth keeping: what this run used, plus stages it did not touch"""
+        with self._lock:
+            active = {key.split(".", 1)[0] for key in self.used}
+            return {
+                key: value for key, value in self.entries.items()
+                if key in self.used or key.split(".", 1)[0] not in active
+            }
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+def memoized(memo, kind, func, *inputs, on_hit=None):
+    """Return the memoized output for ``inputs``, or call ``func`` and store it
+
+    ``on_hit`` receives a memoized value, e.g. to stream it to a client
+    whole. Without a memo this just calls ``func``.
+    """
+    if memo is None:
+        return func()
+    value = memo.get(kind, *inputs)
+    if value is not None:
+        if on_hit is not None:
+            on_hit(value)
+        return value
+    return memo.put(kind, func(), *inputs)
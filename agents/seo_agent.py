@@ -1,47 +1,107 @@
-from together import Together
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
 import json
+import re
+import time
+
+from agents.compaction import headings_digest
+from agents.llm import LLM, estimate_tokens, parses
+from agents.markdown_utils import has_body, is_toc_section, join_sections, section_heading, split_sections
+from agents.section_memo import memoized
+from agents.seo_analytics import (
+    analyze_content, format_metrics, get_corpus, keyword_density, markdown_to_text, readability, tokenize
+)
+from agents.task_graph import run_task_graph
 
 load_dotenv()
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+# Posts longer than this are rewritten section by section, since a single
+# rewrite is capped at 2000 output tokens.
+SEO_CHUNK_TOKENS = int(os.getenv("SEO_CHUNK_TOKENS", "1200"))
+SEO_MAX_CONCURRENCY = int(os.getenv("SEO_MAX_CONCURRENCY", "4"))
+# "local" extracts keywords with the corpus-weighted RAKE/TF-IDF engine,
+# "llm" asks the model as before. Both measure density and readability locally.
+SEO_KEYWORDS_MODE = os.getenv("SEO_KEYWORDS_MODE", "local")
 
 class SEOAgent:
-    def __init__(self):
-        self.client = Together(api_key=TOGETHER_API_KEY)
+    def __init__(self, llm=None, chunk_tokens=SEO_CHUNK_TOKENS, max_concurrency=SEO_MAX_CONCURRENCY,
+                 keywords_mode=SEO_KEYWORDS_MODE, corpus=None, memo=None):
+        self.llm = llm or LLM()
+        self.chunk_tokens = chunk_tokens
+        self.max_concurrency = max_concurrency
+        self.keywords_mode = keywords_mode
+        self.corpus = corpus
+        # With a SectionMemo, unchanged sections keep their earlier rewrite
+        # and the job keeps its first keywords so those rewrites stay valid.
+        self.memo = memo
 
-    def read_blog_content(self, filename="blog_post.md"):
+    def read_blog_content(self, filename="blog_post.md", output_dir="output"):
         """Read blog content from the output directory"""
         try:
-            filepath = os.path.join("output", filename)
+            filepath = os.path.join(output_dir, filename)
             with open(filepath, "r") as f:
                 return f.read()
         except Exception as e:
             print(f"Error reading blog content: {str(e)}")
             return None
 
-    def save_seo_outputs(self, seo_output):
+    def save_seo_outputs(self, seo_output, output_dir="output"):
         """Save all SEO-related outputs to files"""
         try:
-            os.makedirs("output", exist_ok=True)
+            os.makedirs(output_dir, exist_ok=True)
             
-            with open("output/seo_optimized_blog.md", "w") as f:
+            with open(os.path.join(output_dir, "seo_optimized_blog.md"), "w") as f:
                 f.write(seo_output["optimized_content"])
             
-            with open("output/schema_markup.json", "w") as f:
+            with open(os.path.join(output_dir, "schema_markup.json"), "w") as f:
                 f.write(seo_output["schema_markup"])
             
-            with open("output/keyword_analysis.json", "w") as f:
+            with open(os.path.join(output_dir, "keyword_analysis.json"), "w") as f:
                 json.dump(seo_output["keywords"], f, indent=2)
             
-            print("SEO outputs saved successfully to output directory")
+            print(f"SEO outputs saved successfully to {output_dir}")
             return True
         except Exception as e:
             print(f"Error saving SEO outputs: {str(e)}")
             return False
 
+    def measure_keywords(self, blog_content, keywords):
+        """Add keyword density and readability measured on the post"""
+        words = tokenize(markdown_to_text(blog_content))
+        keywords["keyword_density"] = {
+            keyword: keyword_density(words, keyword.lower())
+            for keyword in [keywords["primary_keyword"], *keywords["secondary_keywords"]]
+        }
+        keywords["readability"] = readability(blog_content)
+        return keywords
+
     def analyze_keywords(self, blog_content):
-        """Analyze blog content to determine optimal keywords"""
+        """Determine the keywords and measure keyword density and readability"""
+        previous = self.memo.get("seo.keywords") if self.memo is not None else None
+        if previous is not None:
+            return self.measure_keywords(blog_content, dict(previous))
+
+        keywords = self.extract_keywords(blog_content)
+        if self.memo is not None:
+            self.memo.put("seo.keywords", {
+                key: keywords[key] for key in ("primary_keyword", "secondary_keywords", "lsi_keywords", "source")
+            })
+        return keywords
+
+    def extract_keywords(self, blog_content):
+        if self.keywords_mode == "llm":
+            keywords = self.measure_keywords(blog_content, self.analyze_keywords_llm(blog_content))
+            keywords["source"] = "llm"
+            return keywords
+
+        corpus = self.corpus or get_corpus()
+        keywords = analyze_content(blog_content, corpus)
+        if corpus.add_document(blog_content):
+            corpus.schedule_save()
+        return keywords
+
+    def analyze_keywords_llm(self, blog_content):
+        """Ask the model for the optimal keywords"""
         keyword_prompt = f"""
         Analyze this blog content and extract SEO keywords. Return ONLY a JSON object in this exact format:
         {{
@@ -57,27 +117,11 @@ class SEOAgent:
         """
 
         try:
-            response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                messages=[{"role": "user", "content": keyword_prompt}],
-                max_tokens=500,
-                temperature=0.3
+            content = self.llm.chat(
+                keyword_prompt, max_tokens=500, temperature=0.3, task="seo.analyze_keywords",
+                cacheable=parses(self.parse_keywords)
             )
-
-            content = response.choices[0].message.content.strip()
-            
-            import re
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                content = json_match.group()
-
-            keywords = json.loads(content)
-            
-            required_keys = ['primary_keyword', 'secondary_keywords', 'lsi_keywords']
-            if not all(key in keywords for key in required_keys):
-                raise ValueError("Missing required keys in keyword analysis")
-                
-            return keywords
+            return self.parse_keywords(content)
 
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON response: {e}")
@@ -95,20 +139,40 @@ class SEOAgent:
                 "lsi_keywords": ["related1", "related2", "related3", "related4", "related5"]
             }
 
-    def optimize(self, blog_content=None):
-        if blog_content is None:
-            blog_content = self.read_blog_content()
-            if blog_content is None:
-                raise ValueError("No blog content provided or found in output directory")
+    def parse_keywords(self, content):
+        """Parse the keyword JSON out of a response, raising when it is unusable"""
+        json_match = re.search(r'\{.*\}', content, re.DOTALL)
+        if json_match:
+            content = json_match.group()
 
-        keywords = self.analyze_keywords(blog_content)
-        
+        keywords = json.loads(content)
+
+        required_keys = ['primary_keyword', 'secondary_keywords', 'lsi_keywords']
+        if not all(key in keywords for key in required_keys):
+            raise ValueError("Missing required keys in keyword analysis")
+
+        return keywords
+
+    def keyword_lists(self, keywords):
+        """The keyword fields a rewrite depends on, for memo keys"""
+        return [keywords["primary_keyword"], keywords["secondary_keywords"], keywords["lsi_keywords"]]
+
+    def rewrite_content(self, blog_content, keywords):
+        """Rewrite the blog post around the analyzed keywords"""
+        return memoized(
+            self.memo, "seo.content", lambda: self.rewrite_content_llm(blog_content, keywords),
+            blog_content, self.keyword_lists(keywords)
+        )
+
+    def rewrite_content_llm(self, blog_content, keywords):
         seo_prompt = f"""
         Enhance this blog post for SEO while maintaining its professional tone and readability.
         
         Primary keyword: {keywords['primary_keyword']}
         Secondary keywords: {', '.join(keywords['secondary_keywords'])}
         LSI keywords: {', '.join(keywords['lsi_keywords'])}
+
+        Measured on the current post: {format_metrics(keywords)}
         
         Please:
         1. Add an SEO-optimized meta description (155 characters max) using the primary keyword
@@ -129,15 +193,94 @@ class SEOAgent:
         {blog_content}
         """
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": seo_prompt}],
-            max_tokens=2000,
-            temperature=0.5
-        )
+        return self.llm.chat(seo_prompt, max_tokens=2000, temperature=0.5, task="seo.rewrite_content")
+
+    def rewrite_section(self, section, keywords, headings, first=False, last=False):
+        """Rewrite one ``##`` section around the analyzed keywords"""
+        extra = []
+        if first:
+            extra.append("Start with an SEO-optimized meta description (155 characters max) using the primary keyword, "
+                         "make sure the H1 contains the primary keyword, and suggest relevant meta tags")
+        if last:
+            extra.append("End with a strategic CTA that aligns with the content topic, followed by internal linking "
+                         "suggestions based on the topic and keywords")
+        extra = "".join(f"\n        {index}. {item}" for index, item in enumerate(extra, start=5))
+
+        seo_prompt = f"""
+        Enhance this section of a blog post for SEO while maintaining its professional tone and readability.
+
+        Primary keyword: {keywords['primary_keyword']}
+        Secondary keywords: {', '.join(keywords['secondary_keywords'])}
+        LSI keywords: {', '.join(keywords['lsi_keywords'])}
+
+        Measured on the whole post: {format_metrics(keywords)}
+
+        The full post has these sections:
+        {headings}
+
+        Please:
+        1. Optimize the headings with relevant keywords
+        2. Naturally incorporate the keywords that fit this section
+        3. Enhance readability with shorter paragraphs, bullet points for lists and transition sentences
+        4. Include relevant statistics and data points{extra}
+
+        Return ONLY the rewritten section in markdown, starting with its heading. Do not add a table of contents.
 
-        optimized_content = response.choices[0].message.content.strip()
+        Original section:
+        {section}
+        """
+
+        max_tokens = min(2000, 2 * estimate_tokens(section) + 300)
+        return self.llm.chat(seo_prompt, max_tokens=max_tokens, temperature=0.5, task="seo.rewrite_section")
+
+    def rewrite_sections(self, blog_content, keywords):
+        """Rewrite a long post section by section and stitch it back together
+
+        Sections are rewritten concurrently. Heading numbering and the table
+        of contents are rebuilt locally once they are joined.
+        """
+        chunks = []
+        for chunk in split_sections(blog_content):
+            if is_toc_section(chunk):
+                continue
+            # Keep a bare title attached to the section that follows it.
+            if chunks and not has_body(chunks[-1]):
+                chunks[-1] = f"{chunks[-1]}\n\n{chunk}"
+            else:
+                chunks.append(chunk)
+        if not chunks:
+            return blog_content
+
+        headings = headings_digest(chunks)
+
+        def rewrite(item):
+            index, chunk = item
+            if not has_body(chunk):
+                return chunk
+            first, last = index == 0, index == len(chunks) - 1
+            # Keyed on the section itself, not the list of headings, so an
+            # edit elsewhere in the post does not invalidate this rewrite.
+            result = memoized(
+                self.memo, "seo.section", lambda: self.rewrite_section(chunk, keywords, headings, first, last),
+                chunk, self.keyword_lists(keywords), first, last
+            )
+            heading = section_heading(chunk)
+            if heading and section_heading(result) is None:
+                result = f"{heading}\n\n{result}"
+            return result
 
+        max_workers = max(1, min(self.max_concurrency, len(chunks)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="seo-section") as pool:
+            return join_sections(pool.map(rewrite, enumerate(chunks)))
+
+    def generate_schema(self, blog_content, keywords):
+        """Generate JSON-LD schema markup from the keywords and opening paragraph"""
+        return memoized(
+            self.memo, "seo.schema", lambda: self.generate_schema_llm(blog_content, keywords),
+            blog_content[:500], keywords["primary_keyword"], keywords["secondary_keywords"]
+        )
+
+    def generate_schema_llm(self, blog_content, keywords):
         schema_prompt = f"""
         Create JSON-LD schema markup for this blog post. Include:
         1. Article schema (using primary keyword: {keywords['primary_keyword']})
@@ -153,22 +296,35 @@ class SEOAgent:
         Secondary: {', '.join(keywords['secondary_keywords'])}
         """
 
-        schema_response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[{"role": "user", "content": schema_prompt}],
-            max_tokens=1000,
-            temperature=0.3
-        )
+        return self.llm.chat(schema_prompt, max_tokens=1000, temperature=0.3, task="seo.generate_schema")
 
-        schema_markup = schema_response.choices[0].message.content.strip()
+    def optimize(self, blog_content=None):
+        if blog_content is None:
+            blog_content = self.read_blog_content()
+            if blog_content is None:
+                raise ValueError("No blog content provided or found in output directory")
+
+        rewrite = self.rewrite_content
+        if estimate_tokens(blog_content) > self.chunk_tokens:
+            rewrite = self.rewrite_sections
+
+        # The schema only needs the keywords and the opening of the original
+        # post, so it runs alongside the rewrite instead of after it.
+        tasks = {
+            "analyze_keywords": (lambda _: self.analyze_keywords(blog_content), []),
+            "rewrite": (lambda deps: rewrite(blog_content, deps["analyze_keywords"]), ["analyze_keywords"]),
+            "schema": (lambda deps: self.generate_schema(blog_content, deps["analyze_keywords"]), ["analyze_keywords"])
+        }
+
+        started = time.perf_counter()
+        results, timings = run_task_graph(tasks)
+        timings["total"] = round(time.perf_counter() - started, 3)
 
         final_output = {
-            "keywords": keywords,
-            "optimized_content": optimized_content,
-            "schema_markup": schema_markup
+            "keywords": results["analyze_keywords"],
+            "optimized_content": results["rewrite"],
+            "schema_markup": results["schema"],
+            "timings": timings
         }
         
-        self.save_seo_outputs(final_output)
-        
         return final_output
-
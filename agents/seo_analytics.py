@@ -0,0 +1,329 @@
+from collections import Counter
+from dotenv import load_dotenv
+import atexit
+import glob
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+
+load_dotenv()
+SEO_CORPUS_PATH = os.getenv("SEO_CORPUS_PATH", os.path.join(".cache", "seo_corpus.json"))
+OUTPUT_ROOT = os.getenv("OUTPUT_ROOT", "output")
+# New documents are written to disk at most this often, off the request path.
+SEO_CORPUS_SAVE_INTERVAL = float(os.getenv("SEO_CORPUS_SAVE_INTERVAL", "30"))
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each even few for from further get gets had has have having
+he her here hers herself him himself his how however i if in into is it its itself just let like made make makes
+many may me might more most much must my myself new no nor not now of off often on once one only or other our ours
+ourselves out over own per rather same she should so some such than that the their theirs them themselves then
+there these they this those through thus to too under until up upon us use used uses using very via was way we well
+were what when where whether which while who whom why will with within without would yet you your yours yourself
+yourselves across along already among another around become becomes every including instead less still take
+""".split())
+
+CODE_BLOCK_RE = re.compile(r"```.*?```", re.DOTALL)
+INLINE_CODE_RE = re.compile(r"`[^`]*`")
+LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+HEADING_LINE_RE = re.compile(r"^#{1,6}\s+(.*)$", re.MULTILINE)
+LIST_MARKER_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+", re.MULTILINE)
+EMPHASIS_RE = re.compile(r"[*_~|>]+")
+WORD_RE = re.compile(r"[a-z][a-z0-9'+-]*[a-z0-9]|[a-z]")
+PHRASE_SPLIT_RE = re.compile(r"[.,;:!?()\[\]{}\"\n–—/]+")
+SENTENCE_RE = re.compile(r"[^.!?]+[.!?]*")
+
+def markdown_to_text(content):
+    """Strip markdown syntax, code and links down to the readable text"""
+    text = CODE_BLOCK_RE.sub(" ", content or "")
+    text = INLINE_CODE_RE.sub(" ", text)
+    text = LINK_RE.sub(r"\1", text)
+    text = HTML_TAG_RE.sub(" ", text)
+    text = HEADING_LINE_RE.sub(r"\1.", text)
+    text = LIST_MARKER_RE.sub("", text)
+    return EMPHASIS_RE.sub("", text)
+
+def tokenize(text):
+    return WORD_RE.findall(text.lower())
+
+def is_content_word(word):
+    # Two-letter words stay in: "ai", "hr" and "ux" are often the topic.
+    return word not in STOPWORDS and len(word) > 1 and not word.isdigit()
+
+def candidate_phrases(text, max_words=3):
+    """RAKE-style candidates: runs of content words between stopwords and punctuation"""
+    phrases = []
+    for fragment in PHRASE_SPLIT_RE.split(text.lower()):
+        run = []
+        for word in tokenize(fragment) + [None]:
+            if word is not None and is_content_word(word):
+                run.append(word)
+                continue
+            # Long runs are cut into windows so every phrase stays short.
+            for start in range(0, len(run), max_words):
+                phrases.append(" ".join(run[start:start + max_words]))
+            run = []
+    return phrases
+
+def rake_scores(phrases):
+    """Score phrases by the degree/frequency ratio of their words"""
+    frequency, degree = Counter(), Counter()
+    for phrase in phrases:
+        words = phrase.split()
+        for word in words:
+            frequency[word] += 1
+            degree[word] += len(words)
+    word_score = {word: degree[word] / frequency[word] for word in frequency}
+    return {phrase: sum(word_score[word] for word in phrase.split()) for phrase in set(phrases)}
+
+def count_syllables(word):
+    groups = re.findall(r"[aeiouy]+", word)
+    count = len(groups) - (1 if word.endswith("e") and len(groups) > 1 else 0)
+    return max(1, count)
+
+class CorpusModel:
+    """Document frequencies of words and phrases across past posts
+
+    IDF weights from this model push down terms every post uses (e.g. "ai",
+    "business") so the keywords reflect what this post is specifically
+    about. It is persisted as JSON and grows with every analyzed post.
+    Documents are counted once by content hash, so reruns, resumes and
+    variants of a post do not skew the IDF.
+    """
+
+    def __init__(self, path=SEO_CORPUS_PATH, save_interval=SEO_CORPUS_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.documents = 0
+        self.frequencies = Counter()
+        self.hashes = set()
+        self._dirty = False
+        self._timer = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def terms(self, text):
+        words = [word for word in tokenize(text) if is_content_word(word)]
+        return set(words) | set(candidate_phrases(text))
+
+    def add_document(self, content):
+        """Count a post's terms, returning False when it was already counted"""
+        digest = hashlib.sha256((content or "").encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if digest in self.hashes:
+                return False
+        terms = self.terms(markdown_to_text(content))
+        with self._lock:
+            if digest in self.hashes:
+                return False
+            self.hashes.add(digest)
+            self.documents += 1
+            self.frequencies.update(terms)
+            self._dirty = True
+        return True
+
+    def idf(self, term):
+        return math.log((1 + self.documents) / (1 + self.frequencies.get(term, 0))) + 1
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        with self._lock:
+            self.documents = data.get("documents", 0)
+            self.frequencies = Counter(data.get("frequencies", {}))
+            self.hashes = set(data.get("hashes", []))
+        return True
+
+    def save(self):
+        """Write the model atomically; concurrent saves never share a temp file"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "documents": self.documents,
+                    "frequencies": dict(self.frequencies),
+                    "hashes": sorted(self.hashes)
+                }
+                self._dirty = False
+            f = tempfile.NamedTemporaryFile(
+                "w", dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp", delete=False
+            )
+            try:
+                with f:
+                    json.dump(data, f)
+                os.replace(f.name, self.path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                if os.path.exists(f.name):
+                    os.remove(f.name)
+                raise
+
+    def schedule_save(self):
+        """Save in the background, at most once per ``save_interval`` seconds"""
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.save_interval, self._save_scheduled)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _save_scheduled(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Save now if there are unsaved documents"""
+        with self._lock:
+            dirty = self._dirty
+        if not dirty:
+            return
+        try:
+            self.save()
+        except OSError as e:
+            print(f"Error saving SEO corpus: {str(e)}")
+
+    def build(self, output_root=OUTPUT_ROOT):
+        """Seed the model from the final posts already in the output directory"""
+        paths = glob.glob(os.path.join(output_root, "**", "final_blog.md"), recursive=True)
+        for path in paths:
+            try:
+                with open(path) as f:
+                    self.add_document(f.read())
+            except OSError:
+                continue
+        return len(paths)
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+def get_corpus():
+    """Return the process-wide corpus model, building it on first use"""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = CorpusModel()
+            if not _corpus.load() and _corpus.build():
+                _corpus.save()
+            # Documents added since the last background save are kept at exit.
+            atexit.register(_corpus.flush)
+        return _corpus
+
+def set_corpus(corpus):
+    """Replace the process-wide corpus model, e.g. with a throwaway one"""
+    global _corpus
+    with _corpus_lock:
+        previous, _corpus = _corpus, corpus
+    return previous
+
+def keyword_density(words, keyword):
+    """Share of the post's words taken up by a keyword, in percent"""
+    if not words:
+        return 0.0
+    keyword_words = keyword.split()
+    size = len(keyword_words)
+    occurrences = sum(1 for i in range(len(words) - size + 1) if words[i:i + size] == keyword_words)
+    return round(occurrences * size / len(words) * 100, 2)
+
+def readability(content):
+    """Sentence and paragraph length statistics plus Flesch reading ease"""
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", CODE_BLOCK_RE.sub("", content or "")):
+        block = block.strip()
+        if not block or block.startswith("#") or LIST_MARKER_RE.match(block) or block.startswith("|"):
+            continue
+        paragraphs.append(markdown_to_text(block))
+
+    text = markdown_to_text(content)
+    words = tokenize(text)
+    sentences = [s for s in SENTENCE_RE.findall(text) if tokenize(s)]
+    paragraph_sentences = [len([s for s in SENTENCE_RE.findall(p) if tokenize(s)]) for p in paragraphs]
+
+    word_count, sentence_count = len(words), max(1, len(sentences))
+    syllables = sum(count_syllables(word) for word in words)
+    flesch = 206.835 - 1.015 * (word_count / sentence_count) - 84.6 * (syllables / max(1, word_count))
+    return {
+        "words": word_count,
+        "sentences": len(sentences),
+        "paragraphs": len(paragraphs),
+        "avg_sentence_words": round(word_count / sentence_count, 1),
+        "avg_paragraph_sentences": round(sum(paragraph_sentences) / max(1, len(paragraphs)), 1),
+        "long_paragraphs": sum(1 for count in paragraph_sentences if count > 4),
+        "flesch_reading_ease": round(flesch, 1)
+    }
+
+def analyze_content(content, corpus=None, secondary=5, lsi=8):
+    """Extract primary, secondary and LSI keywords with density and readability
+
+    Phrases are scored by RAKE, weighted by how often they occur and by
+    their corpus IDF, and boosted when they appear in a heading.
+    """
+    text = markdown_to_text(content)
+    words = tokenize(text)
+    headings = " ".join(HEADING_LINE_RE.findall(content or "")).lower()
+
+    phrases = candidate_phrases(text)
+    counts = Counter(phrases)
+    scores = {}
+    for phrase, rake in rake_scores(phrases).items():
+        idf = corpus.idf(phrase) if corpus is not None else 1.0
+        boost = 1.5 if re.search(rf"\b{re.escape(phrase)}\b", headings) else 1.0
+        scores[phrase] = rake * math.log(1 + counts[phrase]) * idf * boost
+    ranked = sorted(scores, key=lambda phrase: (-scores[phrase], phrase))
+
+    def overlaps(phrase, chosen):
+        return any(re.search(rf"\b{re.escape(phrase)}\b", c) or re.search(rf"\b{re.escape(c)}\b", phrase) for c in chosen)
+
+    multiword = [p for p in ranked if len(p.split()) > 1 and counts[p] > 1]
+    primary = multiword[0] if multiword else (ranked[0] if ranked else "")
+
+    chosen = [primary] if primary else []
+    # Prefer repeated phrases, then fill up with one-off ones.
+    for repeated in (True, False):
+        for phrase in ranked:
+            if len(chosen) > secondary:
+                break
+            if (counts[phrase] > 1) == repeated and not overlaps(phrase, chosen):
+                chosen.append(phrase)
+    secondary_keywords = chosen[1:]
+
+    chosen_words = {word for phrase in chosen for word in phrase.split()}
+    unigram_counts = Counter(word for word in words if is_content_word(word) and word not in chosen_words)
+    unigram_scores = {
+        word: count * (corpus.idf(word) if corpus is not None else 1.0)
+        for word, count in unigram_counts.items()
+    }
+    lsi_keywords = sorted(unigram_scores, key=lambda word: (-unigram_scores[word], word))[:lsi]
+
+    return {
+        "primary_keyword": primary,
+        "secondary_keywords": secondary_keywords,
+        "lsi_keywords": lsi_keywords,
+        "keyword_density": {keyword: keyword_density(words, keyword) for keyword in chosen},
+        "readability": readability(content),
+        "source": "local"
+    }
+
+def format_metrics(analysis):
+    """Render the measured metrics for a rewrite prompt"""
+    stats = analysis.get("readability")
+    if not stats:
+        return "Not measured."
+    density = ", ".join(f"'{keyword}' {value}%" for keyword, value in analysis.get("keyword_density", {}).items())
+    return (
+        f"{stats['words']} words, {stats['avg_sentence_words']} words per sentence on average, "
+        f"{stats['avg_paragraph_sentences']} sentences per paragraph on average, "
+        f"{stats['long_paragraphs']} paragraphs longer than 4 sentences, "
+        f"Flesch reading ease {stats['flesch_reading_ease']}. "
+        f"Keyword density: {density or 'n/a'} (aim for 1-2% for the primary keyword)."
+    )
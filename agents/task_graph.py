@@ -0,0 +1,42 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import time
+
+def run_task_graph(tasks, max_workers=4):
+    """Run a small dependency graph of blocking calls, in parallel where possible
+
+    ``tasks`` maps a name to ``(func, dependencies)``. Each ``func`` receives
+    a dict with the results of the tasks it depends on. Returns the results
+    and the wall time of every task, in seconds.
+    """
+    results = {}
+    timings = {}
+    pending = dict(tasks)
+    running = {}
+
+    def timed(name, func, inputs):
+        started = time.perf_counter()
+        try:
+            return func(inputs)
+        finally:
+            timings[name] = round(time.perf_counter() - started, 3)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-graph") as pool:
+        while pending or running:
+            ready = [
+                name for name, (_, deps) in pending.items()
+                if all(dep in results for dep in deps)
+            ]
+            for name in ready:
+                func, deps = pending.pop(name)
+                inputs = {dep: results[dep] for dep in deps}
+                running[pool.submit(timed, name, func, inputs)] = name
+
+            if not running:
+                raise ValueError(f"Unresolvable task dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+
+    return results, timings
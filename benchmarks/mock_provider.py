@@ -0,0 +1,369 @@
+"""Local stand-in for the Together and Cohere APIs
+
+Serves ``POST /v1/chat/completions`` (including ``stream: true`` as
+server-sent events) and ``POST /v1/generate`` with canned outputs shaped
+like the real responses, so the whole pipeline can run without API quota.
+Latency, throughput and error rates are configurable.
+
+    python -m benchmarks.mock_provider --port 8900 --latency-ms 800 --tokens-per-second 60
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+RESEARCH_OUTPUT = """#### **Trending {topic} Topics in 2025**
+1. **Predictive Analytics**: Models trained on historical records now flag risks weeks earlier, and adoption doubled in the last year.
+2. **Workflow Automation**: Routine documentation is increasingly automated, saving teams several hours per week.
+3. **Personalized Experiences**: Recommendation engines tailor content and services to individual needs at scale.
+4. **Responsible AI Governance**: New regulation is pushing organizations to audit models for bias and transparency.
+5. **Edge Deployment**: Smaller models running on devices cut latency and keep sensitive data local.
+
+#### **Final Selected Topic:**
+**Predictive Analytics** – It has the clearest measurable impact and the broadest set of real-world examples."""
+
+RESEARCH_JSON_OUTPUT = {
+    "trending_topics": [
+        {"topic": "Predictive Analytics", "details": "Models trained on historical records now flag risks weeks earlier."},
+        {"topic": "Workflow Automation", "details": "Routine documentation is increasingly automated."},
+        {"topic": "Personalized Experiences", "details": "Recommendation engines tailor services to individual needs."},
+        {"topic": "Responsible AI Governance", "details": "New regulation is pushing organizations to audit models."},
+        {"topic": "Edge Deployment", "details": "Smaller models on devices cut latency and keep data local."}
+    ],
+    "selected_topic": "Predictive Analytics",
+    "selected_topic_details": "It has the clearest measurable impact and the broadest set of real-world examples."
+}
+
+OUTLINE_OUTPUT = """# Predictive Analytics in {topic}
+## Introduction
+- Why predictive analytics matters now
+## Understanding Predictive Models
+- How models learn from historical data
+### Data Sources
+- Records, sensors and third-party data
+## Real-World Applications
+- Case studies and measurable outcomes
+## Challenges and Best Practices
+- Data quality, bias and governance
+## Future Outlook
+- Where the field is heading next
+## Conclusion
+- Actionable takeaways for leaders"""
+
+KEYWORDS_OUTPUT = {
+    "primary_keyword": "predictive analytics",
+    "secondary_keywords": ["machine learning", "data quality", "risk prediction", "ai governance", "case studies"],
+    "lsi_keywords": ["forecasting", "historical data", "model accuracy", "automation", "bias", "transparency", "edge ai", "outcomes"]
+}
+
+SUGGESTIONS_OUTPUT = {
+    "content_suggestions": ["Add a short case study to each section", "Quantify outcomes where possible"],
+    "seo_suggestions": ["Use the primary keyword in the first paragraph", "Add internal links to related posts"],
+    "engagement_suggestions": ["End with a question for readers", "Add a downloadable checklist"]
+}
+
+SCHEMA_OUTPUT = json.dumps({
+    "@context": "https://schema.org",
+    "@type": "Article",
+    "headline": "Predictive Analytics",
+    "keywords": "predictive analytics, machine learning"
+}, indent=2)
+
+# Section titles of the outline, which a correct run keeps in the final post.
+OUTLINE_TITLES = re.findall(r"^#{2,3} (.+)$", OUTLINE_OUTPUT, re.MULTILINE)
+
+# Rewrite and review prompts end with the text they work on, after one of
+# these markers; the section-level markers have to be checked first.
+ECHO_MARKERS = (
+    "Original section:",
+    "Section to enhance:",
+    "Section to review:",
+    "Original content:",
+    "Content to review:",
+    "Content to enhance:",
+    "Content:"
+)
+
+PARAGRAPH = (
+    "Predictive analytics turns historical data into forward-looking decisions. "
+    "Teams that invest in data quality see more accurate models and faster results. "
+    "Clear governance keeps those models fair, transparent and trusted by the people who rely on them."
+)
+
+def canned_response(prompt, max_tokens):
+    """Pick an output in the format the calling agent expects"""
+    topic_match = re.search(r"expert (.+?) researcher", prompt)
+    topic = topic_match.group(1) if topic_match else "Technology"
+
+    if '"trending_topics"' in prompt:
+        text = json.dumps(RESEARCH_JSON_OUTPUT, indent=2)
+    elif "Final Selected Topic" in prompt:
+        text = RESEARCH_OUTPUT.format(topic=topic)
+    elif "Create a detailed blog outline" in prompt:
+        text = OUTLINE_OUTPUT.format(topic=topic)
+    elif "extract SEO keywords" in prompt:
+        text = json.dumps(KEYWORDS_OUTPUT, indent=2)
+    elif "JSON-LD" in prompt:
+        text = SCHEMA_OUTPUT
+    elif "suggestions for improvement" in prompt:
+        text = json.dumps(SUGGESTIONS_OUTPUT, indent=2)
+    elif "Write a detailed section" in prompt:
+        # The section and its subsections follow the outline context.
+        section = prompt.split("Write this section:", 1)[-1]
+        headings = [h.strip() for h in re.findall(r"^\s*(#{1,3} .+)$", section, re.MULTILINE)] or ["## Section"]
+        text = "\n\n".join([headings[0]] + [PARAGRAPH] * 2 + [f"{h}\n\n{PARAGRAPH}" for h in headings[1:]])
+    else:
+        # Rewrite and review passes return the article or section they were given.
+        for marker in ECHO_MARKERS:
+            if marker in prompt:
+                text = prompt.split(marker, 1)[1].strip()
+                break
+        else:
+            text = PARAGRAPH
+
+    words = text.split(" ")
+    if len(words) > max_tokens:
+        text = " ".join(words[:max_tokens])
+    return text
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+class MockConfig:
+    """Latency, throughput and failure behaviour of the stand-in server"""
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, tokens_per_second=60, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def first_token_delay(self):
+        """Sample time-to-first-token from a lognormal around ``latency_ms``"""
+        with self._lock:
+            sample = self.random.lognormvariate(math.log(max(self.latency_ms, 1)), self.latency_sigma)
+        return sample / 1000.0
+
+    def generation_time(self, completion_tokens):
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return completion_tokens / self.tokens_per_second
+
+    def roll_failure(self):
+        """Return 429, 500 or None for the next request"""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+        return None
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        failure = self.config.roll_failure()
+        if failure == 429:
+            time.sleep(self.config.first_token_delay() / 10)
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}},
+                            {"Retry-After": str(self.config.retry_after)})
+            return
+        if failure == 500:
+            time.sleep(self.config.first_token_delay())
+            self._send_json(500, {"error": {"message": "Mock upstream error"}})
+            return
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat_completion(body)
+        elif self.path.rstrip("/").endswith("/generate"):
+            self._cohere_generate(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat_completion(self, body):
+        prompt = body["messages"][-1]["content"]
+        text = canned_response(prompt, body.get("max_tokens", 512))
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        completion_id = f"mock-{uuid.uuid4().hex[:12]}"
+
+        time.sleep(self.config.first_token_delay())
+
+        if not body.get("stream"):
+            time.sleep(self.config.generation_time(completion_tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = re.findall(r"\S+\s*", text)
+        delay = self.config.generation_time(completion_tokens) / max(len(chunks), 1)
+        for index, chunk in enumerate(chunks):
+            event = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": chunk},
+                    "finish_reason": "stop" if index == len(chunks) - 1 else None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _cohere_generate(self, body):
+        prompt = body.get("prompt", "")
+        text = canned_response(prompt, body.get("max_tokens", 512))
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+
+        response = {
+            "id": f"mock-{uuid.uuid4().hex[:12]}",
+            "generations": [{"id": uuid.uuid4().hex[:12], "text": text}],
+            "prompt": prompt,
+            "meta": {"billed_units": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}}
+        }
+
+        if not body.get("stream"):
+            time.sleep(self.config.first_token_delay() + self.config.generation_time(completion_tokens))
+            self._send_json(200, response)
+            return
+
+        # Cohere streams newline-delimited JSON, ending with the full response.
+        time.sleep(self.config.first_token_delay())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/stream+json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = re.findall(r"\S+\s*", text)
+        delay = self.config.generation_time(completion_tokens) / max(len(chunks), 1)
+        for index, chunk in enumerate(chunks):
+            self.wfile.write((json.dumps({"index": 0, "text": chunk, "is_finished": False}) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay)
+        final = {"is_finished": True, "finish_reason": "COMPLETE", "response": response}
+        self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+class MockProviderServer:
+    """Run the stand-in server on a background thread"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        handler = type("ConfiguredHandler", (MockProviderHandler,), {"config": config or MockConfig()})
+        self.config = handler.config
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def together_base_url(self):
+        return f"{self.base_url}/v1"
+
+    @property
+    def cohere_url(self):
+        return f"{self.base_url}/v1/generate"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-provider", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Simulated generation speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument("--seed", type=int, default=None)
+
+def config_from_args(args):
+    return MockConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the mock Together/Cohere provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockProviderServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Mock provider listening on {server.base_url}")
+    print(f"  TOGETHER_BASE_URL={server.together_base_url}")
+    print(f"  COHERE_API_URL={server.cohere_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
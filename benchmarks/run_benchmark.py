@@ -0,0 +1,228 @@
+"""End-to-end pipeline benchmark against the local mock provider
+
+Drives ``generate_blog_with_updates`` (the websocket path) and the batch
+CLI at N concurrent jobs, then reports end-to-end and per-stage latency
+percentiles, jobs/minute and event-loop lag. No API quota is used, and jobs,
+outputs and the SEO corpus live in a temporary directory.
+
+    python -m benchmarks.run_benchmark --jobs 20 --concurrency 10 --mode websocket
+    python -m benchmarks.run_benchmark --jobs 20 --concurrency 10 --mode cli
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from agents.providers import ProviderRegistry, set_registry
+from agents.rate_limit import RateLimitScheduler, set_scheduler
+from agents.seo_analytics import CorpusModel, set_corpus
+from benchmarks.mock_provider import OUTLINE_TITLES, MockProviderServer, add_config_arguments, config_from_args
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None
+    }
+
+def lost_titles(content):
+    """Outline headings missing from a final post, i.e. a stage dropped a section"""
+    content = (content or "").casefold()
+    return [title for title in OUTLINE_TITLES if title.casefold() not in content]
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up from short sleeps"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        return summarize([sample * 1000 for sample in self.samples])
+
+class RecordingWebSocket:
+    """Stands in for a FastAPI WebSocket and timestamps every message"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_json(self, data):
+        self.messages.append((time.perf_counter(), data))
+
+    def stage_durations(self, finished_at):
+        """Time between consecutive stage messages, keyed by the stage status"""
+        stages = [(t, m["status"]) for t, m in self.messages if m.get("agent")]
+        durations = {}
+        for index, (started, status) in enumerate(stages):
+            ended = stages[index + 1][0] if index + 1 < len(stages) else finished_at
+            durations[status] = ended - started
+        return durations
+
+async def run_websocket_benchmark(jobs, concurrency, topic, workdir):
+    import main
+    from jobs import JobManager, JobStore
+
+    # A job manager of its own, so benchmark jobs stay out of the real job
+    # store and output directory.
+    store = JobStore(os.path.join(workdir, "jobs.sqlite"))
+    previous_manager = main.job_manager
+    main.job_manager = JobManager(store=store, retention=0, output_root=os.path.join(workdir, "output"))
+    try:
+        return await drive_websocket_jobs(main.generate_blog_with_updates, jobs, concurrency, topic)
+    finally:
+        await main.job_manager.stop()
+        main.job_manager = previous_manager
+
+async def drive_websocket_jobs(generate_blog_with_updates, jobs, concurrency, topic):
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, stage_latencies, failures, malformed = [], {}, 0, 0
+
+    async def one_job(index):
+        nonlocal failures, malformed
+        async with semaphore:
+            websocket = RecordingWebSocket()
+            started = time.perf_counter()
+            await generate_blog_with_updates(websocket, f"{topic} {index}", use_cache=False)
+            finished = time.perf_counter()
+
+        last = websocket.messages[-1][1] if websocket.messages else {}
+        if last.get("status") != "completed":
+            failures += 1
+            return
+        if lost_titles((last.get("content") or {}).get("final_content")):
+            malformed += 1
+        latencies.append(finished - started)
+        for stage, duration in websocket.stage_durations(finished).items():
+            stage_latencies.setdefault(stage, []).append(duration)
+
+    await asyncio.gather(*[one_job(index) for index in range(jobs)])
+    return latencies, stage_latencies, failures, malformed
+
+async def run_cli_benchmark(jobs, concurrency, topic, workdir):
+    from generate_blog import generate_batch
+
+    topics_path = os.path.join(workdir, "topics.txt")
+    with open(topics_path, "w") as f:
+        f.write("\n".join(f"{topic} {index}" for index in range(jobs)))
+
+    summary = await generate_batch(
+        topics_path,
+        concurrency=concurrency,
+        requests_per_minute=1_000_000,
+        output_root=os.path.join(workdir, "output"),
+        use_cache=False
+    )
+
+    results = summary["results"]
+    malformed = 0
+    for result in results:
+        if result["status"] != "completed":
+            continue
+        with open(os.path.join(result["output_dir"], "final_blog.md")) as f:
+            if lost_titles(f.read()):
+                malformed += 1
+
+    latencies = [r["latency_seconds"] for r in results if r["status"] == "completed"]
+    failures = sum(1 for r in results if r["status"] != "completed")
+    return latencies, {}, failures, malformed
+
+async def run_benchmark(args):
+    server = MockProviderServer(config_from_args(args)).start()
+    previous = set_registry(ProviderRegistry(
+        together_api_key="mock",
+        cohere_api_key="mock",
+        together_base_url=server.together_base_url,
+        cohere_url=server.cohere_url
+    ))
+    # The mock has no quota; only its injected 429s should slow jobs down.
+    previous_scheduler = set_scheduler(RateLimitScheduler({
+        "together": (1_000_000, 0),
+        "cohere": (1_000_000, 0)
+    }))
+    # Mock posts must not end up in the SEO corpus that real keyword
+    # extraction weighs terms against.
+    workdir = tempfile.TemporaryDirectory()
+    previous_corpus = set_corpus(CorpusModel(path=os.path.join(workdir.name, "seo_corpus.json")))
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    try:
+        if args.mode == "cli":
+            results = await run_cli_benchmark(args.jobs, args.concurrency, args.topic, workdir.name)
+        else:
+            results = await run_websocket_benchmark(args.jobs, args.concurrency, args.topic, workdir.name)
+        latencies, stage_latencies, failures, malformed = results
+    finally:
+        wall_time = time.perf_counter() - started
+        loop_lag = await monitor.stop()
+        set_registry(previous)
+        set_scheduler(previous_scheduler)
+        set_corpus(previous_corpus)
+        server.stop()
+        workdir.cleanup()
+
+    # Latency numbers are only meaningful if the mock replies kept every
+    # section; a reply in the wrong shape silently shortens the pipeline.
+    assert not malformed, f"{malformed} completed posts lost outline headings; check the mock's canned responses"
+
+    return {
+        "mode": args.mode,
+        "jobs": args.jobs,
+        "concurrency": args.concurrency,
+        "completed": len(latencies),
+        "failed": failures,
+        "wall_time_seconds": round(wall_time, 2),
+        "jobs_per_minute": round(len(latencies) / wall_time * 60, 2) if wall_time else None,
+        "end_to_end_seconds": summarize(latencies),
+        "stage_seconds": {stage: summarize(values) for stage, values in stage_latencies.items()},
+        "event_loop_lag_ms": loop_lag,
+        "mock_provider": server.config.stats
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the blog pipeline against a mock provider")
+    parser.add_argument("--mode", choices=("websocket", "cli"), default="websocket")
+    parser.add_argument("--jobs", type=int, default=10, help="Total pipelines to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="Pipelines in flight at once")
+    parser.add_argument("--topic", default="Benchmark Topic")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    add_config_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["end_to_end_seconds"]["p50"] is not None:
+        print(f"\np50={report['end_to_end_seconds']['p50']}s "
+              f"p99={report['end_to_end_seconds']['p99']}s "
+              f"jobs/min={report['jobs_per_minute']} "
+              f"loop lag p99={report['event_loop_lag_ms']['p99']}ms")
@@ -1,57 +1,233 @@
-from agents.research_agent import ResearchAgent
-from agents.planning_agent import PlanningAgent
-from agents.content_agent import ContentAgent
-from agents.seo_agent import SEOAgent
-from agents.review_agent import ReviewAgent
-
-def generate_blog():
-    # Hardcoded topic
-    topic = "Artificial Intelligence in Healthcare"
-    
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+from agents.rate_limit import COHERE_RPM, COHERE_TPM, TOGETHER_RPM, TOGETHER_TPM, RateLimiter, RateLimitScheduler, set_scheduler
+from pipeline import OUTPUT_ROOT, FileCheckpointStore, PipelineContext, run_pipeline, run_variants
+
+STAGE_MESSAGES = {
+    "research": ("Step 1: Research Phase", "🔍 Research Agent: Gathering comprehensive data on the topic...", "✅ Research completed!\n"),
+    "planning": ("Step 2: Planning Phase", "📋 Planning Agent: Creating structured outline...", "✅ Outline created!\n"),
+    "content": ("Step 3: Content Generation Phase", "✍️ Content Agent: Generating engaging blog content...", "✅ Content generated!\n"),
+    "seo": ("Step 4: SEO Optimization Phase", "🎯 SEO Agent: Optimizing content for search engines...", "✅ SEO optimization completed!\n"),
+    "review": ("Step 5: Review Phase", "👀 Review Agent: Performing final review and polish...", "✅ Final review completed!\n"),
+}
+
+async def print_stage_update(event):
+    title, started, completed = STAGE_MESSAGES[event["stage"]]
+    if "variant" in event:
+        # Variants run side by side, so keep their updates to one line each.
+        print(f"[{event['variant']}] {title}: {event['state']}")
+        return
+    if event["state"] == "started":
+        print(title)
+        print(started)
+    elif event["state"] == "restored":
+        print(f"{title}\n♻️  Restored from checkpoint\n")
+    else:
+        print(completed)
+
+async def generate_blog(topic, use_cache=True, job_id=None, edited_outline=None, regenerate_sections=(), variants=None,
+                        output_root=OUTPUT_ROOT):
     print("\n🚀 Starting Blog Generation Process...")
     print(f"📝 Topic: {topic}\n")
 
+    ctx = PipelineContext(
+        topic=topic, job_id=job_id, year=2025, num_topics=5, use_cache=use_cache,
+        edited_outline=edited_outline, regenerate_sections=regenerate_sections,
+        edit_id=uuid.uuid4().hex[:12] if regenerate_sections else None,
+        output_root=output_root
+    )
     try:
-        print("Step 1: Research Phase")
-        print("🔍 Research Agent: Gathering comprehensive data on the topic...")
-        research_agent = ResearchAgent()
-        research_output = research_agent.research(topic=topic, year=2025, num_topics=5)
-        print("✅ Research completed!\n")
-
-        # Step 2: Planning
-        print("Step 2: Planning Phase")
-        print("📋 Planning Agent: Creating structured outline...")
-        planning_agent = PlanningAgent()
-        outline = planning_agent.plan(research_output)
-        print("✅ Outline created!\n")
-
-        # Step 3: Content Generation
-        print("Step 3: Content Generation Phase")
-        print("✍️ Content Agent: Generating engaging blog content...")
-        content_agent = ContentAgent()
-        content_agent.generate(outline)
-        print("✅ Content generated!\n")
-
-        # Step 4: SEO Optimization
-        print("Step 4: SEO Optimization Phase")
-        print("🎯 SEO Agent: Optimizing content for search engines...")
-        seo_agent = SEOAgent()
-        seo_agent.optimize()
-        print("✅ SEO optimization completed!\n")
-
-        # Step 5: Final Review
-        print("Step 5: Review Phase")
-        print("👀 Review Agent: Performing final review and polish...")
-        review_agent = ReviewAgent()
-        final_content = review_agent.final_review()
-        print("✅ Final review completed!\n")
+        if variants:
+            await run_variants(ctx, variants, emit=print_stage_update, checkpoints=FileCheckpointStore(ctx.output_root))
+        else:
+            await run_pipeline(ctx, emit=print_stage_update, checkpoints=FileCheckpointStore(ctx.output_root))
+        await ctx.flush()
+
+        reused = ctx.section_memo.stats()["hits"] if ctx.section_memo is not None else 0
+        if reused:
+            print(f"♻️  Reused {reused} unchanged section results")
 
         # Final Output
         print("🎉 Blog Generation Completed Successfully!")
-        print("\n=== Final Blog Content saved in output directory ===")
-        
+        print(f"\n=== Final Blog Content saved in {ctx.output_dir} ===")
+        for name, child in ctx.variants.items():
+            print(f"  {name}: {'failed: ' + child.error if child.error else child.output_dir}")
+
     except Exception as e:
         print(f"\n❌ Error occurred: {str(e)}")
+        extra = f" --output-root {output_root}" if output_root != OUTPUT_ROOT else ""
+        print(f"Resume with: python generate_blog.py --topic \"{topic}\" --job-id {ctx.job_id}{extra}")
+
+def load_topics(path):
+    """Read topics from a CSV (with a "topic" column), JSONL or plain text file"""
+    topics = []
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                if row.get("topic", "").strip():
+                    topics.append(row["topic"].strip())
+        elif path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    topics.append(json.loads(line)["topic"].strip())
+        else:
+            topics = [line.strip() for line in f if line.strip()]
+    return list(dict.fromkeys(topics))
+
+def topic_slug(topic, options=None):
+    """Job id and directory name for a batch topic
+
+    A readable prefix of the topic plus a hash of the whole topic and the
+    options, so topics that share a prefix or differ only in punctuation
+    never share checkpoints or results.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")[:55].strip("-") or "topic"
+    key = json.dumps([" ".join(topic.casefold().split()), options or {}], sort_keys=True)
+    return f"{slug}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}"
+
+async def generate_topic(topic, semaphore, rate_limiter, output_root, use_cache):
+    """Generate one batch topic into its own directory, skipping finished ones"""
+    job_id = topic_slug(topic, {"year": 2025, "num_topics": 5, "use_cache": use_cache})
+    output_dir = os.path.join(output_root, job_id)
+    result_path = os.path.join(output_dir, "result.json")
+    if os.path.exists(result_path):
+        with open(result_path) as f:
+            result = json.load(f)
+        if result["status"] == "completed":
+            print(f"⏭️  Skipping completed topic: {topic}")
+            return {**result, "skipped": True}
+
+    async with semaphore:
+        print(f"🚀 Starting: {topic}")
+        ctx = PipelineContext(
+            topic=topic,
+            job_id=job_id,
+            output_root=output_root,
+            use_cache=use_cache,
+            rate_limiter=rate_limiter,
+            priority="batch"
+        )
+        started = time.perf_counter()
+        try:
+            await run_pipeline(ctx, checkpoints=FileCheckpointStore(output_root))
+            await ctx.flush()
+            status, error = "completed", None
+            print(f"✅ Completed: {topic}")
+        except Exception as e:
+            status, error = "failed", str(e)
+            print(f"❌ Failed: {topic} ({error})")
+
+    result = {
+        "topic": topic,
+        "status": status,
+        "error": error,
+        "output_dir": ctx.output_dir,
+        "latency_seconds": round(time.perf_counter() - started, 2),
+        "usage": dict(ctx.usage or {})
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+async def generate_batch(topics_path, concurrency=4, requests_per_minute=60, output_root=OUTPUT_ROOT, use_cache=True):
+    """Generate many topics concurrently under a shared concurrency and RPM budget"""
+    topics = load_topics(topics_path)
+    print(f"\n🚀 Starting batch of {len(topics)} topics (concurrency={concurrency}, rpm={requests_per_minute})\n")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(requests_per_minute)
+    # Every call also passes the process-wide provider limiters, so raise them
+    # to the batch budget; otherwise --rpm is silently capped at TOGETHER_RPM.
+    previous_scheduler = set_scheduler(RateLimitScheduler({
+        "together": (max(TOGETHER_RPM, requests_per_minute), TOGETHER_TPM),
+        "cohere": (max(COHERE_RPM, requests_per_minute), COHERE_TPM)
+    }))
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*[
+            generate_topic(topic, semaphore, rate_limiter, output_root, use_cache)
+            for topic in topics
+        ])
+    finally:
+        set_scheduler(previous_scheduler)
+
+    summary = {
+        "topics": len(results),
+        "completed": sum(1 for r in results if r["status"] == "completed"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "skipped": sum(1 for r in results if r.get("skipped")),
+        "wall_time_seconds": round(time.perf_counter() - started, 2),
+        "prompt_tokens": sum(r["usage"].get("prompt_tokens", 0) for r in results if not r.get("skipped")),
+        "completion_tokens": sum(r["usage"].get("completion_tokens", 0) for r in results if not r.get("skipped")),
+        "prompt_tokens_saved": sum(r["usage"].get("prompt_tokens_saved", 0) for r in results if not r.get("skipped")),
+        "results": results
+    }
+    os.makedirs(output_root, exist_ok=True)
+    summary_path = os.path.join(output_root, "batch_summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n🎉 Batch finished: {summary['completed']} completed, {summary['failed']} failed, {summary['skipped']} skipped")
+    print(f"=== Summary saved to {summary_path} ===")
+    return summary
+
+def parse_variant(spec):
+    """Parse "NAME[:WORDS[:AUDIENCE]]", e.g. "short:600:busy executives" """
+    name, _, rest = spec.partition(":")
+    words, _, audience = rest.partition(":")
+    if words and not words.isdigit():
+        raise argparse.ArgumentTypeError(f"Word budget must be a number: {spec}")
+    return {"name": name, "word_budget": int(words) if words else None, "audience": audience or None}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a blog post from the terminal")
+    parser.add_argument("--topic", default="Artificial Intelligence in Healthcare", help="Topic to research and write about")
+    parser.add_argument("--job-id", help="Resume an earlier run from its stage checkpoints")
+    parser.add_argument("--outline", help="With --job-id: Markdown file with an edited outline to write the post from")
+    parser.add_argument("--regenerate", action="append", default=[], metavar="HEADING",
+                        help="With --job-id: rewrite this section from scratch (repeatable)")
+    parser.add_argument("--variant", action="append", default=[], type=parse_variant, metavar="NAME[:WORDS[:AUDIENCE]]",
+                        help="Write this variant from the same research and outline (repeatable)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache for fresh sampling")
+    parser.add_argument("--batch", help="CSV, JSONL or text file of topics to generate in one run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pipelines to run at once in batch mode")
+    parser.add_argument("--rpm", type=int, default=60,
+                        help="Provider requests per minute across the whole batch; overrides lower TOGETHER_RPM/COHERE_RPM")
+    parser.add_argument("--output-root", default=OUTPUT_ROOT, help="Directory that receives one folder per topic or job")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    generate_blog()
\ No newline at end of file
+    args = parse_args()
+    if args.batch:
+        asyncio.run(generate_batch(
+            args.batch,
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            output_root=args.output_root,
+            use_cache=not args.no_cache
+        ))
+    elif (args.outline or args.regenerate) and not args.job_id:
+        print("--outline and --regenerate edit an earlier run; pass its --job-id")
+    else:
+        edited_outline = None
+        if args.outline:
+            with open(args.outline) as f:
+                edited_outline = f.read()
+        asyncio.run(generate_blog(
+            args.topic,
+            use_cache=not args.no_cache,
+            job_id=args.job_id,
+            edited_outline=edited_outline,
+            regenerate_sections=args.regenerate,
+            variants=args.variant,
+            output_root=args.output_root
+        ))
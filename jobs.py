@@ -0,0 +1,536 @@
+from dotenv import load_dotenv
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from pipeline import OUTPUT_ROOT, PipelineContext, STAGE_PROGRESS, STAGES, run_blocking, run_pipeline, run_variants
+
+load_dotenv()
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(".cache", "jobs.sqlite"))
+JOBS_MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "8"))
+# Unfinished jobs whose record has not been touched for this long are
+# assumed orphaned (e.g. their worker process died) and get picked up again.
+JOBS_STALE_AFTER = int(os.getenv("JOBS_STALE_AFTER", "300"))
+# Finished jobs and their checkpoints are deleted this many seconds after
+# their last update; 0 keeps them forever.
+JOBS_RETENTION = int(os.getenv("JOBS_RETENTION", str(7 * 24 * 3600)))
+# How often followers of a job running in another worker process poll its record.
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "2"))
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+def status_event(job):
+    """A ``status`` event describing a stored job record"""
+    return {
+        "type": "status",
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "content": job["result"],
+        "message": job["error"]
+    }
+
+def job_key(topic, options=None):
+    """Identify identical requests by normalized topic and output-affecting options"""
+    options = options or {}
+    topic = " ".join(re.sub(r"[^\w\s]", " ", topic.casefold()).split())
+    return json.dumps([
+        topic,
+        options.get("year", 2025),
+        options.get("num_topics", 5),
+        options.get("use_cache", True),
+        options.get("variants"),
+        # A streaming client cannot follow a job that produces no deltas.
+        options.get("stream", False)
+    ])
+
+class JobStore:
+    """SQLite-backed job records and per-stage checkpoints"""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                options TEXT NOT NULL,
+                job_key TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                artifact TEXT NOT NULL,
+                input_hash TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, stage)
+            );
+            """
+        )
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(checkpoints)")]
+        if "input_hash" not in columns:
+            # Older databases: their checkpoints have no hash and get recomputed.
+            self._conn.execute("ALTER TABLE checkpoints ADD COLUMN input_hash TEXT")
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "job_key" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN job_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_job_key ON jobs (job_key, status)")
+        self._conn.commit()
+
+    def create_unique(self, topic, options=None):
+        """Create a job unless an identical one is unfinished; return ``(job, created)``
+
+        The lookup and insert share one write transaction, so worker
+        processes sharing this database never start the same job twice.
+        """
+        key = job_key(topic, options)
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE job_key = ? AND status IN ('queued', 'running') "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (key,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, topic, options, job_key, status, progress, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?)",
+                        (job_id, topic, json.dumps(options or {}), key, now, now)
+                    )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        if row is not None:
+            return self.get(row["id"]), False
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            stages = [
+                r["stage"] for r in self._conn.execute(
+                    "SELECT stage FROM checkpoints WHERE job_id = ? ORDER BY created_at", (job_id,)
+                )
+            ]
+
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["completed_stages"] = [stage for stage in stages if stage in STAGES]
+        return job
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        if "options" in fields:
+            fields["options"] = json.dumps(fields["options"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def claim(self, job_id, updated_at):
+        """Mark a job running unless another worker touched it since ``updated_at``"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', error = NULL, updated_at = ? "
+                "WHERE id = ? AND updated_at = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id, updated_at)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def touch(self, job_id):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def list_stale(self, stale_after=JOBS_STALE_AFTER):
+        """Return unfinished jobs nobody has worked on for ``stale_after`` seconds"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND updated_at < ? "
+                "ORDER BY created_at",
+                (time.time() - stale_after,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def cleanup(self, retention=JOBS_RETENTION):
+        """Delete finished jobs older than ``retention`` seconds, with their checkpoints
+
+        Checkpoints of a job's variants (``<job_id>/variants/<name>``) go with it.
+        Returns the number of jobs deleted.
+        """
+        cutoff = time.time() - retention
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (cutoff,)
+            ).fetchall()
+            for row in rows:
+                self._conn.execute(
+                    "DELETE FROM checkpoints WHERE job_id = ? OR job_id LIKE ?", (row["id"], f"{row['id']}/%")
+                )
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+            self._conn.commit()
+        return len(rows)
+
+    def load(self, job_id):
+        """Return ``{stage: {"input_hash": ..., "artifact": ...}}`` for a job"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, artifact, input_hash FROM checkpoints WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {
+            row["stage"]: {"input_hash": row["input_hash"], "artifact": json.loads(row["artifact"])}
+            for row in rows
+        }
+
+    def save(self, job_id, stage, artifact, input_hash):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, artifact, input_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, stage, json.dumps(artifact), input_hash, time.time())
+            )
+            self._conn.commit()
+
+class JobManager:
+    """Runs queued jobs on a bounded pool of workers and fans out their events"""
+
+    def __init__(self, store=None, concurrency=JOBS_MAX_CONCURRENCY, stale_after=JOBS_STALE_AFTER,
+                 retention=JOBS_RETENTION, output_root=OUTPUT_ROOT):
+        self.store = store
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self.retention = retention
+        self.output_root = output_root
+        self.queue = None
+        self.workers = []
+        self.events = {}
+        self.subscribers = {}
+        # Job key -> id of the unfinished job computing it in this process;
+        # jobs in other processes are found through the store's job_key column.
+        self.inflight = {}
+        self.tasks = set()
+
+    async def start(self):
+        if self.store is None:
+            self.store = await run_blocking(JobStore)
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self.workers.append(asyncio.create_task(self._recover_stale_jobs()))
+        if self.retention > 0:
+            self.workers.append(asyncio.create_task(self._cleanup_old_jobs()))
+
+    async def stop(self):
+        tasks = self.workers + list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.tasks = set()
+
+    async def _recover_stale_jobs(self):
+        """Requeue orphaned jobs so they resume from their last checkpoint"""
+        while True:
+            try:
+                for job_id in await run_blocking(self.store.list_stale, self.stale_after):
+                    if job_id not in self.events:
+                        self.events[job_id] = []
+                        self.queue.put_nowait(job_id)
+            except Exception as e:
+                print(f"Error recovering stale jobs: {str(e)}")
+            await asyncio.sleep(self.stale_after)
+
+    async def _cleanup_old_jobs(self):
+        """Delete expired jobs about once an hour so the store does not grow without bound"""
+        while True:
+            try:
+                deleted = await run_blocking(self.store.cleanup, self.retention)
+                if deleted:
+                    print(f"Deleted {deleted} expired jobs")
+            except Exception as e:
+                print(f"Error deleting expired jobs: {str(e)}")
+            await asyncio.sleep(min(3600, self.retention))
+
+    async def _keep_alive(self, job_id):
+        while True:
+            await asyncio.sleep(max(1, self.stale_after / 3))
+            await run_blocking(self.store.touch, job_id)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _start_watch(self, job):
+        """Relay an unfinished job running in another worker process, unless this one has it"""
+        if job["id"] in self.events:
+            return
+        self.events[job["id"]] = []
+        self._spawn(self._watch(job["id"], job_key(job["topic"], job["options"])))
+
+    async def _schedule(self, job_id, immediate=False):
+        """Queue a job, or with ``immediate`` start it now outside the worker pool
+
+        Immediate jobs have a client waiting on them and get interactive
+        priority for provider calls; queued jobs run at batch priority.
+        """
+        if immediate:
+            self._spawn(self._run_job(job_id, priority="interactive"))
+        else:
+            await self.queue.put(job_id)
+
+    async def submit(self, topic, options=None, immediate=False):
+        """Start a job, or return the identical one that is already in flight
+
+        Interactive callers pass ``immediate`` so their job does not wait
+        behind queued background jobs.
+        """
+        if self.queue is None:
+            # Started lazily when used outside the FastAPI app, e.g. by the benchmark.
+            await self.start()
+        key = job_key(topic, options)
+        job_id = self.inflight.get(key)
+        if job_id is not None:
+            job = await self.get(job_id)
+            if job is not None and job["status"] not in TERMINAL_STATUSES:
+                return {**job, "deduplicated": True}
+
+        job, created = await run_blocking(self.store.create_unique, topic, options)
+        if not created:
+            # Another worker process is computing it; relay its progress here.
+            self._start_watch(job)
+            return {**job, "deduplicated": True}
+        self.inflight[key] = job["id"]
+        self.events[job["id"]] = []
+        await self._schedule(job["id"], immediate)
+        return job
+
+    async def resume(self, job_id, immediate=False):
+        """Re-run a failed or orphaned job from its checkpoints
+
+        Jobs running in this process, completed jobs and jobs another live
+        worker is running are returned as they are, ready to be followed.
+        """
+        if self.queue is None:
+            await self.start()
+        job = await self.get(job_id)
+        if job is None or job_id in self.events or job["status"] == "completed":
+            return job
+        if job["status"] != "failed" and time.time() - job["updated_at"] < self.stale_after:
+            # Another worker process is running it; relay its progress here.
+            self._start_watch(job)
+            return job
+
+        await run_blocking(self.store.update, job_id, status="queued", error=None)
+        self.events[job_id] = []
+        self.inflight.setdefault(job_key(job["topic"], job["options"]), job_id)
+        await self._schedule(job_id, immediate)
+        return await self.get(job_id)
+
+    async def regenerate(self, job_id, outline=None, sections=(), immediate=False):
+        """Re-run a finished job with an edited outline and/or rejected sections
+
+        Only sections whose heading or notes changed, and the ones named in
+        ``sections``, are written again; the rest of the post and its SEO and
+        review work are reused. Jobs that are still running are returned as
+        they are.
+        """
+        if self.queue is None:
+            await self.start()
+        job = await self.get(job_id)
+        if job is None or job_id in self.events or job["status"] not in TERMINAL_STATUSES:
+            return job
+
+        options = {**job["options"], "regenerate_sections": list(sections), "edit_id": uuid.uuid4().hex[:12]}
+        if outline is not None:
+            options["edited_outline"] = outline
+        await run_blocking(self.store.update, job_id, status="queued", error=None, options=options)
+        self.events[job_id] = []
+        self.inflight.setdefault(job_key(job["topic"], job["options"]), job_id)
+        await self._schedule(job_id, immediate)
+        return await self.get(job_id)
+
+    async def get(self, job_id):
+        return await run_blocking(self.store.get, job_id)
+
+    async def follow(self, job_id, send):
+        """Send a job's current state, missed events, then live events until it ends"""
+        job = await self.get(job_id)
+        if job is None:
+            await send({"type": "error", "status": "error", "message": f"Unknown job {job_id}"})
+            return
+
+        if job_id not in self.events:
+            if job["status"] in TERMINAL_STATUSES:
+                await send({"type": "snapshot", "job": job})
+                return
+            # Running in another worker process (or it just finished here, in
+            # which case the watcher reports the final state on its first poll).
+            self._start_watch(job)
+
+        queue = asyncio.Queue()
+        for event in self.events[job_id]:
+            queue.put_nowait(event)
+        self.subscribers.setdefault(job_id, set()).add(queue)
+
+        try:
+            await send({"type": "snapshot", "job": job})
+            while True:
+                event = await queue.get()
+                await send(event)
+                if event["type"] == "status" and event["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            self.subscribers[job_id].discard(queue)
+            if not self.subscribers[job_id]:
+                del self.subscribers[job_id]
+
+    def _publish(self, job_id, event):
+        self.events.setdefault(job_id, []).append(event)
+        for queue in self.subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _watch(self, job_id, key):
+        """Relay a job that another worker process is running to followers here
+
+        Publishes its stage and progress from the store until it ends. If
+        that worker stops touching the record, the job is taken over here
+        instead.
+        """
+        stage = progress = None
+        while True:
+            await asyncio.sleep(JOBS_POLL_INTERVAL)
+            job = await self.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                if job is not None:
+                    self._publish(job_id, status_event(job))
+                self._finish(job_id, key)
+                return
+            if time.time() - job["updated_at"] >= self.stale_after:
+                await self.queue.put(job_id)
+                return
+            if job["stage"] != stage and job["stage"] in STAGES:
+                stage = job["stage"]
+                self._publish(job_id, {"type": "stage", "stage": stage, "state": "started"})
+            if job["progress"] != progress:
+                progress = job["progress"]
+                self._publish(job_id, status_event(job))
+
+    def _finish(self, job_id, key):
+        self.events.pop(job_id, None)
+        if key is not None and self.inflight.get(key) == job_id:
+            del self.inflight[key]
+
+    async def _run_job(self, job_id, priority="batch"):
+        job = await self.get(job_id)
+        key = job_key(job["topic"], job["options"]) if job is not None else None
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            if job is not None:
+                self._publish(job_id, status_event(job))
+            self._finish(job_id, key)
+            return
+        if not await run_blocking(self.store.claim, job_id, job["updated_at"]):
+            # Another worker process picked it up first; followers here get
+            # its progress from the store.
+            self._spawn(self._watch(job_id, key))
+            return
+        self.inflight.setdefault(key, job_id)
+
+        options = job["options"]
+        ctx = PipelineContext(
+            topic=job["topic"],
+            job_id=job_id,
+            year=options.get("year", 2025),
+            num_topics=options.get("num_topics", 5),
+            use_cache=options.get("use_cache", True),
+            edited_outline=options.get("edited_outline"),
+            regenerate_sections=options.get("regenerate_sections", ()),
+            edit_id=options.get("edit_id"),
+            priority=priority,
+            output_root=self.output_root
+        )
+
+        async def emit(event):
+            if event["type"] == "stage" and event["state"] in ("started", "restored"):
+                await run_blocking(
+                    self.store.update, job_id, stage=event["stage"], progress=STAGE_PROGRESS[event["stage"]]
+                )
+            self._publish(job_id, event)
+
+        self._publish(job_id, {"type": "status", "job_id": job_id, "status": "running"})
+        keep_alive = asyncio.create_task(self._keep_alive(job_id))
+
+        try:
+            if options.get("variants"):
+                await run_variants(
+                    ctx, options["variants"], emit=emit, stream=options.get("stream", False), checkpoints=self.store
+                )
+                result = {
+                    "variants": {
+                        name: {"review_output": child.review_output, "error": child.error}
+                        for name, child in ctx.variants.items()
+                    }
+                }
+            else:
+                await run_pipeline(ctx, emit=emit, stream=options.get("stream", False), checkpoints=self.store)
+                result = ctx.review_output
+            await ctx.flush()
+            await run_blocking(
+                self.store.update, job_id, status="completed", progress=100, result=result
+            )
+            self._publish(job_id, {
+                "type": "status",
+                "job_id": job_id,
+                "status": "completed",
+                "progress": 100,
+                "content": result,
+                "usage": ctx.total_usage()
+            })
+        except Exception as e:
+            await run_blocking(self.store.update, job_id, status="failed", error=str(e))
+            self._publish(job_id, {"type": "status", "job_id": job_id, "status": "failed", "message": str(e)})
+        finally:
+            keep_alive.cancel()
+            self._finish(job_id, key)
@@ -1,20 +1,64 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import asyncio
+import re
 
-from agents.research_agent import ResearchAgent
-from agents.planning_agent import PlanningAgent
-from agents.content_agent import ContentAgent
-from agents.seo_agent import SEOAgent
-from agents.review_agent import ReviewAgent
+from agents.llm_cache import get_default_cache
+from agents.metrics import metrics
+from jobs import JobManager, TERMINAL_STATUSES
+from pipeline import STAGE_PROGRESS, STAGES, parse_variants
 
 app = FastAPI()
+job_manager = JobManager()
+
+JOB_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# Options a client may set on a job, with their types and allowed ranges.
+# Everything else in the options bag is internal to the job manager.
+PUBLIC_JOB_OPTIONS = {
+    "year": (int, 2000, 2100),
+    "num_topics": (int, 1, 10),
+    "use_cache": (bool, None, None)
+}
+
+def check_job_id(job_id):
+    if not JOB_ID_RE.fullmatch(job_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+
+def job_options(additional_info):
+    """Validate client-supplied job options, rejecting unknown keys"""
+    options = {}
+    for key, value in (additional_info or {}).items():
+        if key not in PUBLIC_JOB_OPTIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown option: {key}")
+        kind, low, high = PUBLIC_JOB_OPTIONS[key]
+        # bool is a subclass of int, so check it explicitly.
+        if type(value) is not kind:
+            raise HTTPException(status_code=400, detail=f"Option {key} must be {kind.__name__}")
+        if low is not None and not low <= value <= high:
+            raise HTTPException(status_code=400, detail=f"Option {key} must be between {low} and {high}")
+        options[key] = value
+    return options
 
 class BlogRequest(BaseModel):
     topic: str
     additional_info: Optional[dict] = None
 
+class RegenerateRequest(BaseModel):
+    outline: Optional[str] = None
+    sections: List[str] = []
+
+class VariantSpec(BaseModel):
+    name: str
+    word_budget: Optional[int] = None
+    audience: Optional[str] = None
+
+class VariantsRequest(BaseModel):
+    topic: str
+    variants: List[VariantSpec]
+    additional_info: Optional[dict] = None
+
 async def heartbeat(websocket: WebSocket):
     while True:
         try:
@@ -23,7 +67,8 @@ async def heartbeat(websocket: WebSocket):
         except Exception:
             break
 
-async def generate_blog_with_updates(websocket: WebSocket, topic: str):
+async def generate_blog_with_updates(websocket: WebSocket, topic: str, use_cache: bool = True, stream: bool = False,
+                                     job_id: Optional[str] = None):
     steps = [
         {
             "step": 1,
@@ -62,56 +107,82 @@ async def generate_blog_with_updates(websocket: WebSocket, topic: str):
         }
     ]
 
-    try:
-        heartbeat_task = asyncio.create_task(heartbeat(websocket))
+    finished = False
 
-        await websocket.send_json({
-            **steps[0],
-            "progress": 0
-        })
-        research_agent = ResearchAgent()
-        research_output = research_agent.research(topic=topic, year=2025, num_topics=5)
+    async def send_job_update(event):
+        nonlocal finished
+        if event["type"] == "delta":
+            if stream:
+                await websocket.send_json(event)
+            return
+        if event["type"] == "stage":
+            index = STAGES.index(event["stage"])
+            if event["state"] == "restored":
+                # Resumed jobs skip finished stages; still show them as done.
+                await websocket.send_json({
+                    **steps[index],
+                    "message": f"{steps[index]['agent']}: restored from checkpoint",
+                    "estimated_time": "0 seconds",
+                    "progress": STAGE_PROGRESS[event["stage"]],
+                    "restored": True
+                })
+            elif event["state"] == "started":
+                await websocket.send_json({
+                    **steps[index],
+                    "estimated_time": event.get("estimated_time") or steps[index]["estimated_time"],
+                    "progress": STAGE_PROGRESS[event["stage"]]
+                })
+            return
 
-        await websocket.send_json({
-            **steps[1],
-            "progress": 20
-        })
-        planning_agent = PlanningAgent()
-        outline = planning_agent.plan(research_output)
+        # Status events, or the snapshot of a job that already finished.
+        job = event["job"] if event["type"] == "snapshot" else event
+        if finished or job["status"] not in TERMINAL_STATUSES:
+            return
+        finished = True
+        job_id = job.get("job_id") or job.get("id")
+        if job["status"] == "completed":
+            await websocket.send_json({
+                "step": 6,
+                "status": "completed",
+                "message": "Blog post generated successfully!",
+                "progress": 100,
+                "job_id": job_id,
+                "content": job.get("content", job.get("result")),
+                "usage": job.get("usage")
+            })
+        else:
+            await websocket.send_json({
+                "status": "error",
+                "message": job.get("message") or job.get("error"),
+                "job_id": job_id
+            })
 
-        await websocket.send_json({
-            **steps[2],
-            "progress": 40
-        })
-        content_agent = ContentAgent()
-        content_agent.generate(outline)
-        
-        await websocket.send_json({
-            **steps[3],
-            "progress": 70
-        })
-        seo_agent = SEOAgent()
-        seo_agent.optimize()
-        
-        await websocket.send_json({
-            **steps[4],
-            "progress": 90
-        })
-        review_agent = ReviewAgent()
-        final_content = review_agent.final_review()
+    heartbeat_task = asyncio.create_task(heartbeat(websocket))
+    job = None
 
-        await websocket.send_json({
-            "step": 6,
-            "status": "completed",
-            "message": "Blog post generated successfully!",
-            "progress": 100,
-            "content": final_content
-        })
+    try:
+        # Identical in-flight requests share one job; every client gets the
+        # events it missed and then follows along. Passing the job_id of an
+        # earlier, failed run resumes it from its checkpoints.
+        if job_id:
+            job = await job_manager.resume(job_id, immediate=True)
+            if job is None:
+                raise ValueError(f"Unknown job {job_id}")
+        else:
+            job = await job_manager.submit(
+                topic,
+                # Streamed calls are never hedged or retried mid-answer, so
+                # only stream when the client asked for deltas.
+                {"year": 2025, "num_topics": 5, "use_cache": use_cache, "stream": stream},
+                immediate=True
+            )
+        await job_manager.follow(job["id"], send_job_update)
 
     except Exception as e:
         await websocket.send_json({
             "status": "error",
-            "message": str(e)
+            "message": str(e),
+            "job_id": job["id"] if job else None
         })
     finally:
         heartbeat_task.cancel()
@@ -121,11 +192,89 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     try:
         data = await websocket.receive_json()
-        await generate_blog_with_updates(websocket, data["topic"])
+        if data.get("job_id") and not JOB_ID_RE.fullmatch(data["job_id"]):
+            raise ValueError("Invalid job_id")
+        await generate_blog_with_updates(
+            websocket,
+            data["topic"],
+            use_cache=data.get("use_cache", True),
+            stream=data.get("stream", False),
+            job_id=data.get("job_id")
+        )
     except Exception as e:
         await websocket.send_json({
             "status": "error",
             "message": str(e)
         })
     finally:
-        await websocket.close()
\ No newline at end of file
+        await websocket.close()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    cache = get_default_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_job_manager():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_manager():
+    await job_manager.stop()
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: BlogRequest):
+    return await job_manager.submit(request.topic, job_options(request.additional_info))
+
+@app.post("/jobs/variants", status_code=202)
+async def create_variants_job(request: VariantsRequest):
+    try:
+        variants = parse_variants([variant.model_dump() for variant in request.variants])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await job_manager.submit(request.topic, {**job_options(request.additional_info), "variants": variants})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    check_job_id(job_id)
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/regenerate", status_code=202)
+async def regenerate_job(job_id: str, request: RegenerateRequest):
+    check_job_id(job_id)
+    job = await job_manager.regenerate(job_id, outline=request.outline, sections=request.sections)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.websocket("/ws/jobs/{job_id}")
+async def job_websocket(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+    heartbeat_task = asyncio.create_task(heartbeat(websocket))
+    try:
+        if not JOB_ID_RE.fullmatch(job_id):
+            raise ValueError("Invalid job_id")
+        await job_manager.follow(job_id, websocket.send_json)
+    except Exception as e:
+        try:
+            await websocket.send_json({
+                "status": "error",
+                "message": str(e)
+            })
+        except Exception:
+            pass
+    finally:
+        heartbeat_task.cancel()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
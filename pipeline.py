@@ -0,0 +1,571 @@
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+from agents.llm import LLM
+from agents.metrics import metrics, record_stage, stage_history
+from agents.research_index import get_research_index
+from agents.section_memo import SectionMemo
+from agents.research_agent import ResearchAgent
+from agents.planning_agent import PlanningAgent
+from agents.content_agent import ContentAgent, SectionPrefetcher
+from agents.seo_agent import SEOAgent
+from agents.review_agent import ReviewAgent
+
+load_dotenv()
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "64"))
+OUTPUT_ROOT = os.getenv("OUTPUT_ROOT", "output")
+# Start writing sections while the outline is still streaming.
+PIPELINE_OVERLAP = os.getenv("PIPELINE_OVERLAP", "true").lower() in ("1", "true", "yes")
+
+STAGES = ("research", "planning", "content", "seo", "review")
+# With variants, research and planning run once and the rest once per variant.
+SHARED_STAGES = STAGES[:2]
+VARIANT_STAGES = STAGES[2:]
+VARIANT_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+STAGE_PROGRESS = {"research": 0, "planning": 20, "content": 40, "seo": 70, "review": 90}
+
+# Context attribute holding the output of each stage.
+STAGE_ARTIFACTS = {
+    "research": "research_output",
+    "planning": "outline",
+    "content": "final_blog",
+    "seo": "seo_output",
+    "review": "review_output",
+}
+
+# Bump when a stage's prompts or output shape change so old checkpoints
+# are recomputed instead of restored.
+CHECKPOINT_VERSION = "3"
+
+# Checkpoint entry holding the job's SectionMemo next to the stage artifacts.
+SECTION_MEMO_CHECKPOINT = "sections"
+
+# The agents use blocking provider SDKs, so every stage runs on this bounded
+# pool instead of the event loop. One worker can then serve many concurrent
+# generations while websockets and heartbeats keep flowing.
+_executor = ThreadPoolExecutor(
+    max_workers=PIPELINE_MAX_WORKERS,
+    thread_name_prefix="pipeline"
+)
+
+# Disk writes are kept off the critical path on their own small pool.
+_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pipeline-io")
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking agent call on the shared pipeline executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+class PipelineContext:
+    """Per-job state handed between the agents in memory"""
+
+    def __init__(self, topic, job_id=None, year=2025, num_topics=5, persist=True, output_root=OUTPUT_ROOT,
+                 use_cache=True, rate_limiter=None, providers=None, priority="interactive",
+                 edited_outline=None, regenerate_sections=(), edit_id=None, word_budget=None, audience=None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.topic = topic
+        self.year = year
+        self.num_topics = num_topics
+        self.persist = persist
+        self.output_root = output_root
+        self.use_cache = use_cache
+        self.rate_limiter = rate_limiter
+        self.providers = providers
+        self.priority = priority
+        # An edited outline replaces the planning output; the named sections
+        # are written afresh. Everything else is reused where its inputs match.
+        self.edited_outline = edited_outline
+        self.regenerate_sections = list(regenerate_sections or ())
+        self.edit_id = edit_id
+        # Length of the whole post and who it is written for; None keeps the
+        # content agent's defaults.
+        self.word_budget = word_budget
+        self.audience = audience
+        self.overlap = PIPELINE_OVERLAP
+        self.usage = None
+        self.trace = []
+
+        self.research_output = None
+        self.outline = None
+        self.final_blog = None
+        self.seo_output = None
+        self.review_output = None
+        self.section_prefetcher = None
+        self.research_match = None
+        self.section_memo = None
+        self.variants = {}
+        self.error = None
+
+        self._pending_writes = []
+
+    @property
+    def output_dir(self):
+        return os.path.join(self.output_root, self.job_id)
+
+    @property
+    def optimized_content(self):
+        return self.seo_output["optimized_content"] if self.seo_output else None
+
+    @property
+    def keywords(self):
+        return self.seo_output["keywords"] if self.seo_output else None
+
+    @property
+    def schema_markup(self):
+        return self.seo_output["schema_markup"] if self.seo_output else None
+
+    def get_artifact(self, stage):
+        return getattr(self, STAGE_ARTIFACTS[stage])
+
+    def set_artifact(self, stage, value):
+        setattr(self, STAGE_ARTIFACTS[stage], value)
+
+    def variant(self, name, word_budget=None, audience=None):
+        """Return a context that writes a variant of this job's outline
+
+        Its job id is ``<job_id>/variants/<name>``, so its outputs and
+        checkpoints live in a subdirectory of this job's.
+        """
+        child = PipelineContext(
+            self.topic,
+            job_id=f"{self.job_id}/variants/{name}",
+            year=self.year,
+            num_topics=self.num_topics,
+            persist=self.persist,
+            output_root=self.output_root,
+            use_cache=self.use_cache,
+            rate_limiter=self.rate_limiter,
+            providers=self.providers,
+            priority=self.priority,
+            regenerate_sections=self.regenerate_sections,
+            edit_id=self.edit_id,
+            word_budget=word_budget,
+            audience=audience
+        )
+        child.research_output = self.research_output
+        child.outline = self.outline
+        return child
+
+    def total_usage(self):
+        """Token usage of this job plus all of its variants"""
+        total = dict(self.usage or {})
+        for child in self.variants.values():
+            for key, value in (child.usage or {}).items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def save_in_background(self, func, *args):
+        """Schedule a disk write into the job directory without waiting for it"""
+        if not self.persist:
+            return
+        future = asyncio.get_running_loop().run_in_executor(_io_executor, functools.partial(func, *args))
+        self._pending_writes.append(future)
+
+    async def flush(self):
+        """Wait for all scheduled disk writes of this job"""
+        pending, self._pending_writes = self._pending_writes, []
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        for child in self.variants.values():
+            await child.flush()
+
+def save_json(data, output_dir, filename):
+    """Save a JSON artifact into a job directory"""
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, filename), "w") as f:
+            json.dump(data, f, indent=2)
+        return True
+    except Exception as e:
+        print(f"Error saving {filename}: {str(e)}")
+        return False
+
+def save_jsonl(records, output_dir, filename):
+    """Save a list of records as JSON lines into a job directory"""
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, filename), "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return True
+    except Exception as e:
+        print(f"Error saving {filename}: {str(e)}")
+        return False
+
+def save_text(text, output_dir, filename):
+    """Save a text artifact into a job directory"""
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, filename), "w") as f:
+            f.write(text)
+        return True
+    except Exception as e:
+        print(f"Error saving {filename}: {str(e)}")
+        return False
+
+def stage_inputs(ctx, stage):
+    """Return everything a stage's output depends on"""
+    if stage == "research":
+        return {"topic": ctx.topic, "year": ctx.year, "num_topics": ctx.num_topics}
+    if stage == "planning":
+        if ctx.edited_outline is not None:
+            return {"research": ctx.research_output, "edited_outline": ctx.edited_outline}
+        return ctx.research_output
+    if stage == "content":
+        inputs = {"outline": ctx.outline}
+        if ctx.regenerate_sections:
+            inputs.update(regenerate=sorted(ctx.regenerate_sections), edit_id=ctx.edit_id)
+        if ctx.word_budget or ctx.audience:
+            inputs.update(word_budget=ctx.word_budget, audience=ctx.audience)
+        return inputs if len(inputs) > 1 else ctx.outline
+    if stage == "seo":
+        return ctx.final_blog
+    return ctx.optimized_content
+
+def stage_input_hash(ctx, stage):
+    """Content hash of a stage's inputs, used to validate its checkpoint"""
+    payload = json.dumps([CHECKPOINT_VERSION, stage, stage_inputs(ctx, stage)], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def stage_failed(artifact):
+    """Agents report some failures in their output; those are never checkpointed"""
+    return isinstance(artifact, dict) and (artifact.get("status") == "error" or "error" in artifact)
+
+class FileCheckpointStore:
+    """Stage checkpoints stored as JSON next to the job's other outputs"""
+
+    def __init__(self, output_root=OUTPUT_ROOT):
+        self.output_root = output_root
+
+    def _dir(self, job_id):
+        return os.path.join(self.output_root, job_id, "checkpoints")
+
+    def load(self, job_id):
+        """Return ``{stage: {"input_hash": ..., "artifact": ...}}`` for a job"""
+        checkpoints = {}
+        directory = self._dir(job_id)
+        if not os.path.isdir(directory):
+            return checkpoints
+        for stage in STAGES + (SECTION_MEMO_CHECKPOINT,):
+            path = os.path.join(directory, f"{stage}.json")
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            checkpoints[stage] = {"input_hash": record.get("input_hash"), "artifact": record.get("artifact")}
+        return checkpoints
+
+    def save(self, job_id, stage, artifact, input_hash):
+        directory = self._dir(job_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{stage}.json")
+        # Write then rename so a crash never leaves a truncated checkpoint.
+        with open(path + ".tmp", "w") as f:
+            json.dump({"stage": stage, "input_hash": input_hash, "artifact": artifact, "created_at": time.time()}, f)
+        os.replace(path + ".tmp", path)
+
+class EventForwarder:
+    """Deliver pipeline events to ``emit`` in order, from the loop or worker threads"""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.error = None
+        self.task = asyncio.create_task(self._forward())
+
+    async def _forward(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                if self.emit is not None and self.error is None:
+                    await self.emit(event)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def put(self, event):
+        self.queue.put_nowait(event)
+
+    def put_threadsafe(self, event):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    def delta_callback(self, job_id, stage):
+        """Build an agent ``on_delta`` callback that forwards ``delta`` events"""
+        def on_delta(payload):
+            self.put_threadsafe({"type": "delta", "job_id": job_id, "stage": stage, **payload})
+        return on_delta
+
+    async def drain(self):
+        """Wait until queued events are delivered, re-raising a failed emit"""
+        await self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    async def close(self):
+        try:
+            await self.queue.join()
+        finally:
+            self.task.cancel()
+
+async def _research_stage(ctx, llm, on_delta):
+    # Near-duplicate topics reuse recent research instead of a cold call.
+    index = get_research_index() if ctx.use_cache else None
+    match = await run_blocking(index.lookup, ctx.topic, ctx.year, ctx.num_topics) if index is not None else None
+    if match is not None:
+        print(f"Reusing research for '{match['topic']}' (similarity {match['similarity']})")
+        ctx.research_match = match
+        ctx.research_output = match["research"]
+        ctx.trace.append({
+            "type": "research_reuse",
+            "job_id": ctx.job_id,
+            "similar_topic": match["topic"],
+            "similarity": match["similarity"],
+            "age": match["age"]
+        })
+    else:
+        ctx.research_output = await run_blocking(
+            ResearchAgent(llm).research, topic=ctx.topic, year=ctx.year, num_topics=ctx.num_topics
+        )
+    ctx.save_in_background(save_json, ctx.research_output, ctx.output_dir, "research.json")
+
+async def _planning_stage(ctx, llm, on_delta):
+    if ctx.edited_outline is not None:
+        selected_topic = ctx.research_output.get("selected_topic") or ctx.topic
+        ctx.outline = PlanningAgent(llm).finalize_outline(ctx.edited_outline, selected_topic)
+        ctx.save_in_background(save_text, ctx.outline, ctx.output_dir, "outline.md")
+        return
+
+    match = ctx.research_match
+    if match is not None and match["outline"] and match["research"] == ctx.research_output:
+        ctx.outline = match["outline"]
+        if on_delta is not None:
+            on_delta({"text": ctx.outline})
+        ctx.save_in_background(save_text, ctx.outline, ctx.output_dir, "outline.md")
+        return
+
+    planning_agent = PlanningAgent(llm)
+    listeners = []
+    # Prefetched sections are written at the default lengths.
+    if ctx.overlap and not ctx.word_budget:
+        selected_topic = ctx.research_output.get("selected_topic")
+        ctx.section_prefetcher = SectionPrefetcher(
+            content_agent(ctx, llm), prepare=lambda text: planning_agent.finalize_outline(text, selected_topic)
+        )
+        listeners.append(ctx.section_prefetcher.feed)
+    if on_delta is not None:
+        listeners.append(lambda text: on_delta({"text": text}))
+
+    on_token = None
+    if listeners:
+        def on_token(text):
+            for listener in listeners:
+                listener(text)
+
+    ctx.outline = await run_blocking(planning_agent.plan, ctx.research_output, on_token=on_token)
+    ctx.save_in_background(save_text, ctx.outline, ctx.output_dir, "outline.md")
+
+    index = get_research_index() if ctx.use_cache else None
+    if index is not None:
+        await run_blocking(index.add, ctx.topic, ctx.year, ctx.num_topics, ctx.research_output, ctx.outline)
+
+def content_agent(ctx, llm):
+    return ContentAgent(
+        llm,
+        memo=ctx.section_memo,
+        regenerate=ctx.regenerate_sections,
+        word_budget=ctx.word_budget,
+        audience=ctx.audience
+    )
+
+async def _content_stage(ctx, llm, on_delta):
+    agent = content_agent(ctx, llm)
+    ctx.final_blog = await run_blocking(
+        agent.generate, ctx.outline, on_delta=on_delta, prefetcher=ctx.section_prefetcher
+    )
+    ctx.save_in_background(agent.save_blog_content, ctx.final_blog, ctx.output_dir)
+
+async def _seo_stage(ctx, llm, on_delta):
+    seo_agent = SEOAgent(llm, memo=ctx.section_memo)
+    ctx.seo_output = await run_blocking(seo_agent.optimize, ctx.final_blog)
+    ctx.save_in_background(seo_agent.save_seo_outputs, ctx.seo_output, ctx.output_dir)
+
+async def _review_stage(ctx, llm, on_delta):
+    review_agent = ReviewAgent(llm, memo=ctx.section_memo)
+    ctx.review_output = await run_blocking(review_agent.final_review, ctx.optimized_content, on_delta=on_delta)
+    ctx.save_in_background(review_agent.save_review_outputs, ctx.review_output, ctx.output_dir)
+
+STAGE_RUNNERS = {
+    "research": _research_stage,
+    "planning": _planning_stage,
+    "content": _content_stage,
+    "seo": _seo_stage,
+    "review": _review_stage,
+}
+
+async def run_pipeline(ctx, emit=None, stream=False, checkpoints=None, stages=STAGES):
+    """Run the stages of one job, every stage by default, passing artifacts through the context
+
+    ``emit`` is an optional coroutine function that receives progress events
+    of the form ``{"type": "stage", "stage": ..., "state": "started"|"completed"}``.
+    With ``stream`` enabled it also receives ``{"type": "delta", ...}`` events
+    carrying outline, content section and review tokens as they are generated.
+
+    With ``PIPELINE_OVERLAP`` the outline is streamed and each section is
+    dispatched for writing as soon as its ``##`` block is complete, so the
+    content stage mostly waits on the last sections rather than all of them.
+
+    ``checkpoints`` is an optional store with blocking ``load(job_id)`` and
+    ``save(job_id, stage, artifact, input_hash)`` methods. A stage whose
+    checkpoint matches the hash of its current inputs is restored instead of
+    recomputed, so a rerun resumes from the first missing or invalidated
+    stage. Every successful stage is saved to it, along with a SectionMemo
+    of per-section outputs: when an edited outline or rejected sections
+    invalidate the content stage, only sections whose inputs changed are
+    regenerated, and SEO and review only redo the sections that changed.
+    """
+    events = EventForwarder(emit)
+
+    async def notify(stage, state, **fields):
+        events.put({"type": "stage", "job_id": ctx.job_id, "stage": stage, "state": state, **fields})
+        await events.drain()
+
+    llm = LLM(
+        use_cache=ctx.use_cache,
+        rate_limiter=ctx.rate_limiter,
+        providers=ctx.providers,
+        job_id=ctx.job_id,
+        priority=ctx.priority
+    )
+    ctx.usage = llm.usage
+    ctx.trace = llm.trace
+    saved = await run_blocking(checkpoints.load, ctx.job_id) if checkpoints is not None else {}
+    if checkpoints is not None:
+        ctx.section_memo = SectionMemo((saved.get(SECTION_MEMO_CHECKPOINT) or {}).get("artifact"))
+    outcome = "failed"
+
+    try:
+        for stage in stages:
+            input_hash = stage_input_hash(ctx, stage)
+            checkpoint = saved.get(stage)
+            if checkpoint is not None and checkpoint["input_hash"] == input_hash:
+                ctx.set_artifact(stage, checkpoint["artifact"])
+                await notify(stage, "restored")
+                continue
+
+            await notify(stage, "started", estimated_time=stage_history.estimate(stage, None))
+            on_delta = events.delta_callback(ctx.job_id, stage) if stream else None
+            started = time.perf_counter()
+            await STAGE_RUNNERS[stage](ctx, llm, on_delta)
+            duration = time.perf_counter() - started
+            record_stage(stage, duration)
+            ctx.trace.append({"type": "stage", "job_id": ctx.job_id, "stage": stage, "wall_time": round(duration, 4)})
+
+            artifact = ctx.get_artifact(stage)
+            if checkpoints is not None and not stage_failed(artifact):
+                await run_blocking(checkpoints.save, ctx.job_id, stage, artifact, input_hash)
+                if stage in ("content", "seo", "review"):
+                    await run_blocking(
+                        checkpoints.save, ctx.job_id, SECTION_MEMO_CHECKPOINT, ctx.section_memo.snapshot(), None
+                    )
+            await notify(stage, "completed", duration=round(duration, 3))
+        outcome = "completed"
+    finally:
+        if ctx.section_prefetcher is not None:
+            ctx.section_prefetcher.close()
+            ctx.section_prefetcher = None
+        metrics.inc("pipeline_jobs_total", outcome=outcome)
+        if ctx.section_memo is not None:
+            ctx.trace.append({"type": "section_memo", "job_id": ctx.job_id, **ctx.section_memo.stats()})
+        ctx.save_in_background(save_jsonl, list(ctx.trace), ctx.output_dir, "trace.jsonl")
+        await events.close()
+
+    return ctx
+
+def parse_variants(variants):
+    """Validate variant specs into ``{"name", "word_budget", "audience"}`` dicts
+
+    Raises ValueError for a missing, duplicate or unsafe name or a
+    non-positive word budget.
+    """
+    specs, names = [], set()
+    for variant in variants:
+        name = str(variant.get("name") or "")
+        if not VARIANT_NAME_RE.match(name):
+            raise ValueError(f"Invalid variant name: {name!r}")
+        if name in names:
+            raise ValueError(f"Duplicate variant name: {name!r}")
+        names.add(name)
+        word_budget = variant.get("word_budget")
+        if word_budget is not None:
+            word_budget = int(word_budget)
+            if word_budget <= 0:
+                raise ValueError(f"Variant {name!r} needs a positive word budget")
+        specs.append({"name": name, "word_budget": word_budget, "audience": variant.get("audience") or None})
+    if not specs:
+        raise ValueError("At least one variant is required")
+    return specs
+
+async def run_variants(ctx, variants, emit=None, stream=False, checkpoints=None):
+    """Write several variants of one post from a single research and planning pass
+
+    ``variants`` is a list of ``{"name", "word_budget", "audience"}`` specs.
+    Research and planning run once on ``ctx``; content, SEO and review then
+    run concurrently for every variant, each on its own context from
+    ``ctx.variant`` with its own outputs, trace and checkpoints. Events of a
+    variant carry its name under ``"variant"``. A failed variant is recorded
+    in its ``error`` without stopping the others; if all fail the first
+    error is raised.
+    """
+    specs = parse_variants(variants)
+    # Sections streamed off the outline would be written for no variant in particular.
+    ctx.overlap = False
+    await run_pipeline(ctx, emit=emit, stream=stream, checkpoints=checkpoints, stages=SHARED_STAGES)
+
+    ctx.variants = {spec["name"]: ctx.variant(**spec) for spec in specs}
+
+    def variant_emit(name):
+        if emit is None:
+            return None
+
+        async def forward(event):
+            await emit({**event, "variant": name})
+        return forward
+
+    results = await asyncio.gather(*(
+        run_pipeline(child, emit=variant_emit(name), stream=stream, checkpoints=checkpoints, stages=VARIANT_STAGES)
+        for name, child in ctx.variants.items()
+    ), return_exceptions=True)
+
+    errors = []
+    for (name, child), result in zip(ctx.variants.items(), results):
+        if isinstance(result, Exception):
+            child.error = str(result)
+            errors.append(result)
+            print(f"Variant {name} failed: {child.error}")
+
+    summary = {
+        name: {
+            "word_budget": child.word_budget,
+            "audience": child.audience,
+            "status": "failed" if child.error else "completed",
+            "error": child.error,
+            "output_dir": child.output_dir,
+            "usage": dict(child.usage or {})
+        }
+        for name, child in ctx.variants.items()
+    }
+    ctx.save_in_background(save_json, summary, ctx.output_dir, "variants.json")
+    if len(errors) == len(ctx.variants):
+        raise errors[0]
+    return ctx